@@ -3,6 +3,8 @@
 Exported objects:
 Function -- The base class for mathematical functions.
 norm -- a function that calculates the norm of any Function instance.
+norms -- a function that calculates several norms of the same Function instance.
+eval_many -- a function that evaluates several Function instances on the same points.
 exp -- A Function instance relating to the exponential function.
 sin -- A Function instance relating to the sine function.
 arcsin -- A Function instance relating to the inverse sine function.
@@ -16,14 +18,21 @@ sqrt -- A Function instance relating to the square root of x function.
 """
 
 import math
-from numbers import Number # Used only for checking isinstance(n, Number)
-from multiprocessing import Process # Used by the plot method in the Function class
-
-import matplotlib.pyplot as plt
+import os
+import sys
+import functools # Used to cache the integrals, see _tape_integral
+import ctypes # Used to load the compiled C versions of functions
+import hashlib
+import importlib.util # Used to load the kernels compiled by numba
+import subprocess
+import weakref # Used to share equal functions, see _interned
+from numbers import Number # Used for checking isinstance(n, Number), see _is_number
+
+import numpy as np
 
 __all__ = [
     'Function', 'exp', 'sin', 'arcsin', 'cos',
-    'arccos', 'tan', 'arctan', 'log', 'x', 'sqrt'
+    'arccos', 'tan', 'arctan', 'log', 'x', 'sqrt', 'eval_many'
     ]
 __version__ = "1.0.0"
 __author__ = "simmol"
@@ -31,15 +40,62 @@ __author__ = "simmol"
 class Function:
     """Class for creating and handling mathematical functions."""
 
-    def __init__(self, func):
+    # Slots make the attribute lookups in the evaluations faster and the instances
+    # smaller. __weakref__ lets the instances be interned, see _interned.
+    __slots__ = ("_function", "_array_function", "_negation_of", "_node", "_tape",
+                 "_py_kernel", "_njit_kernel", "_c_kernels", "_derivatives",
+                 "__weakref__")
+
+    def __new__(cls, func, array_func=None):
+        """Return the elementary Function instance of func if there is one,
+        e.g. Function(math.exp) is exp, otherwise return a new instance.
+
+        Keyword arguments:
+        func -- See __init__
+        array_func -- See __init__
+        """
+        if array_func is None and cls is Function:
+            try:
+                primitive = _PRIMITIVES.get(func)
+            except TypeError: # func is not hashable
+                primitive = None
+            if primitive is not None:
+                return primitive
+        return super().__new__(cls)
+
+    def __init__(self, func, array_func=None):
         """Set this functions eval method to return func(x).
         Where func is the function provided as input.
 
         Keyword arguments:
         func -- A function that takes a number as input and outputs another
                 number according to some rule.
+        array_func --   A function that takes a numpy array as input and outputs
+                        the evaluation of func in each of its points (defaults to
+                        None, in which case the corresponding numpy ufunc is used if
+                        func is from the math module and otherwise func is called
+                        once for every point).
         """
+        if array_func is None and getattr(self, "_function", None) is not None:
+            return # An elementary function returned by __new__ is already set up
         self._function = func
+        if array_func is None:
+            # The functions of the math module have numpy ufuncs that do the same
+            array_func = _UFUNCS.get(func)
+        self._array_function = array_func
+        # The Function this function is the negation of, see __neg__
+        self._negation_of = None
+        # How this function is built from other functions as (op_code, operands, value)
+        # or None if it is not known. It is flattened to a tape when it is needed,
+        # see _flat_tape.
+        self._node = None
+        self._tape = None # The memoized tape, False if it cannot be built
+        self._py_kernel = None
+        self._njit_kernel = None
+        # The library of a function returned by compile, only such functions are
+        # integrated by the C code so nothing is compiled without asking for it.
+        self._c_kernels = None
+        self._derivatives = {} # The derivatives of this function by (dx, mode)
 
     def eval(self, num):
         """Return the evaluation of the function in the point num
@@ -52,33 +108,96 @@ class Function:
         # to what eval actually does (except for the descriptive name of course).
         return self._function(num)
 
+    def eval_array(self, arr):
+        """Return a numpy array with the evaluation of the function in each point of arr.
+        Points where the function is not defined evaluate to NaN.
+
+        Keyword arguments:
+        arr -- A numpy array of real numbers in the domain of the function
+        """
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            if self._array_function is None:
+                # No vectorized version is known so fall back to one call per point.
+                # The points are converted to python floats first, which the
+                # functions evaluate faster than numpy scalars.
+                function = self._function
+                evals = [function(num) for num in arr.ravel().tolist()]
+                return np.array(evals, dtype=float).reshape(arr.shape)
+            return self._array_function(arr)
+
+    def __eq__(self, other):
+        """Return whether other is a Function instance that is built from the
+        elementary functions in the same way as this function. Functions that are not
+        built from the elementary functions are only equal to themselves.
+        """
+        if not isinstance(other, Function):
+            return NotImplemented
+        if self is other:
+            return True
+        tape = self._flat_tape()
+        return tape is not None and tape == other._flat_tape()
+
+    def __hash__(self):
+        """Return a hash that is equal for equal functions, see __eq__."""
+        tape = self._flat_tape()
+        if tape is None:
+            return id(self)
+        return hash(tuple(tape))
+
     def __call__(self, func_or_num):
         """If func_or_num is a real number return self.eval(func_or_num).
         If func_or_num is an instance of Function return a new Function
         instance whose eval returns self.eval(func_or_num(x)) for any input x.
+        If func_or_num is a numpy array return self.eval_array(func_or_num).
 
         Keyword arguments:
-        func_or_num -- An instance of Function OR a real number.
+        func_or_num -- An instance of Function OR a real number OR a numpy array.
 
         Examples:   exp(sin), would return a new Function that evaluates according to e^(sin(x)).
                     exp(3), would return the same thing as exp.eval(3)
+                    exp(np.array([0, 1])), would return the array [1, e]
         """
-        if isinstance(func_or_num, Number):
-            return self.eval(func_or_num)
+        # Checking the exact type first is much faster than the Number ABC which is
+        # only needed for other kinds of numbers, like the numpy scalars.
+        if type(func_or_num) in _NUMBER_TYPES or isinstance(func_or_num, Number):
+            return self._function(func_or_num) # Same as self.eval without its frame
 
         elif isinstance(func_or_num, Function):
-            def func(num):
-                return self.eval(func_or_num(num))
-            return Function(func)
+            interned = _interned(OP_COMPOSE, self, func_or_num)
+            if interned is not None:
+                return interned
+            # Here and in the other operations the evaluations are bound as default
+            # arguments, which are faster to look up than self.eval on every call.
+            # They are bound to the functions behind eval so every operation only
+            # adds one call, e.g. exp(sin) calls math.exp(math.sin(num)).
+            def func(num, se=self._function, fe=func_or_num._function):
+                return se(fe(num))
+            def func_array(arr):
+                return self.eval_array(func_or_num.eval_array(arr))
+            return _with_node(Function(func, func_array), OP_COMPOSE, self, func_or_num)
+
+        elif isinstance(func_or_num, np.ndarray):
+            return self.eval_array(func_or_num)
 
         else:
-            raise TypeError("can only call a function on a real number or another function.")
+            raise TypeError("can only call a function on a real number, a numpy array or another function.")
 
     def __neg__(self):
-        """Return a new instance of Function that evaluates as -self.eval."""
-        def func(arg):
-            return -self.eval(arg)
-        return Function(func)
+        """Return a new instance of Function that evaluates as -self.eval.
+        If self is itself a negation -f then f is returned.
+        """
+        if self._negation_of is not None:
+            return self._negation_of
+        interned = _interned(OP_NEG, self)
+        if interned is not None:
+            return interned
+        def func(arg, se=self._function):
+            return -se(arg)
+        def func_array(arr):
+            return -self.eval_array(arr)
+        negated = _with_node(Function(func, func_array), OP_NEG, self)
+        negated._negation_of = self
+        return negated
 
     def __pos__(self):
         """Return self."""
@@ -86,7 +205,12 @@ class Function:
 
     def __abs__(self):
         """Return an instance of Function that evaluates as |self.eval| i.e. abs(self.eval)"""
-        return Function(lambda num: abs(self.eval(num)))
+        interned = _interned(OP_ABS, self)
+        if interned is not None:
+            return interned
+        absolute = Function(lambda num, se=self._function: abs(se(num)),
+                            lambda arr: np.abs(self.eval_array(arr)))
+        return _with_node(absolute, OP_ABS, self)
 
     def __add__(self, func_or_num):
         """Return an instance of Function whose eval method returns self.eval + func_or_num.
@@ -96,20 +220,29 @@ class Function:
 
         Example: exp + sin, would return a new Function that evaluates according to e^x + sin(x).
         """
+        if _is_number(func_or_num) and func_or_num == 0:
+            return self # f + 0 is f
+        interned = _interned(OP_ADD, self, func_or_num)
+        if interned is not None:
+            return interned
         if isinstance(func_or_num, Function):
-            def added(num):
-                return self.eval(num) + func_or_num.eval(num)
+            def added(num, se=self._function, fe=func_or_num._function):
+                return se(num) + fe(num)
+            def added_array(arr):
+                return self.eval_array(arr) + func_or_num.eval_array(arr)
 
-        elif isinstance(func_or_num, Number):
-            def added(num):
-                return self.eval(num) + func_or_num
+        elif _is_number(func_or_num):
+            def added(num, se=self._function):
+                return se(num) + func_or_num
+            def added_array(arr):
+                return self.eval_array(arr) + func_or_num
 
         else:
             raise TypeError("unsupported operand type for +.\
             Functions can only be added with real numbers or\
             other functions.")
 
-        return Function(added)
+        return _with_node(Function(added, added_array), OP_ADD, self, func_or_num)
 
     def __radd__(self, func_or_num):
         """Does self.__add__(func_or_num)"""
@@ -123,25 +256,50 @@ class Function:
 
         Example: exp - sin, would return a Function that evaluates to e^x - sin(x).
         """
+        if _is_number(func_or_num) and func_or_num == 0:
+            return self # f - 0 is f
+        interned = _interned(OP_SUB, self, func_or_num)
+        if interned is not None:
+            return interned
         if isinstance(func_or_num, Function):
-            def subtracted(num):
-                return self.eval(num) - func_or_num.eval(num)
+            def subtracted(num, se=self._function, fe=func_or_num._function):
+                return se(num) - fe(num)
+            def subtracted_array(arr):
+                return self.eval_array(arr) - func_or_num.eval_array(arr)
 
-        elif isinstance(func_or_num, Number):
-            def subtracted(num):
-                return self.eval(num) - func_or_num
+        elif _is_number(func_or_num):
+            def subtracted(num, se=self._function):
+                return se(num) - func_or_num
+            def subtracted_array(arr):
+                return self.eval_array(arr) - func_or_num
 
         else:
             raise TypeError("unsupported operand type for -.\
             Functions can only be subtracted with real numbers or\
             other functions.")
 
-        return Function(subtracted)
+        return _with_node(Function(subtracted, subtracted_array), OP_SUB, self, func_or_num)
 
     def __rsub__(self, func_or_num):
-        """Does func_or_num - self"""
-        negated = -self
-        return negated.__add__(func_or_num)
+        """Return an instance of Function whose eval method returns func_or_num - self.eval.
+
+        Keyword arguments:
+        func_or_num -- A real number.
+        """
+        if not _is_number(func_or_num):
+            raise TypeError("unsupported operand type for -.\
+            Functions can only be subtracted with real numbers or\
+            other functions.")
+        if func_or_num == 0:
+            return -self # 0 - f is -f
+        interned = _interned(OP_SUB, func_or_num, self)
+        if interned is not None:
+            return interned
+        def subtracted(num, se=self._function):
+            return func_or_num - se(num)
+        def subtracted_array(arr):
+            return func_or_num - self.eval_array(arr)
+        return _with_node(Function(subtracted, subtracted_array), OP_SUB, func_or_num, self)
 
     def __mul__(self, func_or_num):
         """Return an instance of Function whose eval method is self.eval * func_or_num.
@@ -151,20 +309,29 @@ class Function:
 
         Example: exp * sin, would return a Function that evaluates to e^x * sin(x).
         """
+        if _is_number(func_or_num) and func_or_num == 1:
+            return self # f * 1 is f
+        interned = _interned(OP_MUL, self, func_or_num)
+        if interned is not None:
+            return interned
         if isinstance(func_or_num, Function):
-            def multiplied(num):
-                return self.eval(num) * func_or_num.eval(num)
+            def multiplied(num, se=self._function, fe=func_or_num._function):
+                return se(num) * fe(num)
+            def multiplied_array(arr):
+                return self.eval_array(arr) * func_or_num.eval_array(arr)
 
-        elif isinstance(func_or_num, Number):
-            def multiplied(num):
-                return self.eval(num) * func_or_num
+        elif _is_number(func_or_num):
+            def multiplied(num, se=self._function):
+                return se(num) * func_or_num
+            def multiplied_array(arr):
+                return self.eval_array(arr) * func_or_num
 
         else:
             raise TypeError("unsupported operand type for *.\
             Functions can only be multiplied with real numbers or\
             other functions.")
 
-        return Function(multiplied)
+        return _with_node(Function(multiplied, multiplied_array), OP_MUL, self, func_or_num)
 
     def __rmul__(self, func_or_num):
         """Does self.__mul__(func_or_num)"""
@@ -178,38 +345,63 @@ class Function:
 
         Example: exp / sin, would return a Function that evaluates to e^x / sin(x).
         """
+        if _is_number(func_or_num) and func_or_num == 1:
+            return self # f / 1 is f
+        interned = _interned(OP_DIV, self, func_or_num)
+        if interned is not None:
+            return interned
         # Here special consideration is needed in order to
         # handle cases where func_or_num evaluates to 0
         if isinstance(func_or_num, Function):
-            def divided(num):
-                if func_or_num.eval(num) == 0:
+            def divided(num, se=self._function, fe=func_or_num._function):
+                # Catching the error is free when it is not raised, unlike a check
+                try:
+                    return se(num) / fe(num)
+                except ZeroDivisionError:
                     return float("nan")
-                return self.eval(num) / func_or_num.eval(num)
+            def divided_array(arr):
+                return _divide_array(self.eval_array(arr), func_or_num.eval_array(arr))
 
-        elif isinstance(func_or_num, Number):
+        elif _is_number(func_or_num):
             if func_or_num == 0:
                 def divided(num):
                     return float("nan")
+                def divided_array(arr):
+                    return np.full(arr.shape, np.nan)
             else:
-                def divided(num):
-                    return self.eval(num) / func_or_num
+                def divided(num, se=self._function):
+                    return se(num) / func_or_num
+                def divided_array(arr):
+                    return self.eval_array(arr) / func_or_num
 
         else:
             raise TypeError("unsupported operand type for /.\
             Functions can only be divided with real numbers or\
             other functions.")
 
-        return Function(divided)
+        return _with_node(Function(divided, divided_array), OP_DIV, self, func_or_num)
 
     def __rtruediv__(self, func_or_num):
-        """Does (1/self) * func_or_num instead"""
-        def inverse(num):
-            val = self.eval(num)
-            if val == 0:
+        """Return an instance of Function whose eval method is func_or_num / self.eval.
+
+        Keyword arguments:
+        func_or_num -- A real number.
+        """
+        if not _is_number(func_or_num):
+            raise TypeError("unsupported operand type for /.\
+            Functions can only be divided with real numbers or\
+            other functions.")
+        interned = _interned(OP_DIV, func_or_num, self)
+        if interned is not None:
+            return interned
+        def divided(num, se=self._function):
+            try:
+                return func_or_num / se(num)
+            except ZeroDivisionError:
                 return float("nan")
-            return 1/val
-        inversed = Function(inverse)
-        return inversed.__mul__(func_or_num)
+        def divided_array(arr):
+            return _divide_array(func_or_num, self.eval_array(arr))
+        return _with_node(Function(divided, divided_array), OP_DIV, func_or_num, self)
 
     def __pow__(self, func_or_num):
         """Return an instance of Function whose eval method is self.eval^func_or_num.
@@ -219,59 +411,141 @@ class Function:
 
         Example: exp^sin, would return a Function that evaluates to (e^x)^sin(x).
         """
+        if _is_number(func_or_num) and func_or_num == 1:
+            return self # f ** 1 is f
+        interned = _interned(OP_POW, self, func_or_num)
+        if interned is not None:
+            return interned
         if isinstance(func_or_num, Function):
-            def power(num):
-                return self.eval(num) ** func_or_num.eval(num)
-
-        elif isinstance(func_or_num, Number):
-            def power(num):
-                return self.eval(num) ** func_or_num
+            def power(num, se=self._function, fe=func_or_num._function):
+                return se(num) ** fe(num)
+            def power_array(arr):
+                return _pow_array(self.eval_array(arr), func_or_num.eval_array(arr))
+
+        elif type(func_or_num) in _NUMBER_TYPES and func_or_num in (2, 3, 4):
+            # Small integer powers, also when given as floats like 2.0, are faster
+            # as multiplications than by **
+            if func_or_num == 2:
+                def power(num, se=self._function):
+                    value = se(num)
+                    return value * value
+            elif func_or_num == 3:
+                def power(num, se=self._function):
+                    value = se(num)
+                    return value * value * value
+            else:
+                def power(num, se=self._function):
+                    value = se(num)
+                    square = value * value
+                    return square * square
+            def power_array(arr):
+                return _pow_array(self.eval_array(arr), func_or_num)
+
+        elif _is_number(func_or_num):
+            def power(num, se=self._function):
+                return se(num) ** func_or_num
+            def power_array(arr):
+                return _pow_array(self.eval_array(arr), func_or_num)
 
         else:
             raise TypeError("unsupported operand type for **.\
             Functions can only be raised by a real number or\
             another function.")
 
-        return Function(power)
+        return _with_node(Function(power, power_array), OP_POW, self, func_or_num)
 
     def __rpow__(self, func_or_num):
-        """Rewrite func_or_num^self as (e^self)^log(func_or_num)"""
-        ln_func_or_num = Function(math.log)(func_or_num)
-        exp_self = Function(math.exp)(self)
-        return exp_self.__pow__(ln_func_or_num)
+        """Return an instance of Function whose eval method is func_or_num^self.eval.
+        Points where the power is not a real number evaluate to NaN.
 
-    def derivative(self, dx=0.0001):
+        Keyword arguments:
+        func_or_num -- A real number.
+        """
+        if not _is_number(func_or_num):
+            raise TypeError("unsupported operand type for **.\
+            Functions can only be raised by a real number or\
+            another function.")
+        if func_or_num == math.e:
+            return exp(self)
+        interned = _interned(OP_POW, func_or_num, self)
+        if interned is not None:
+            return interned
+        base = float(func_or_num)
+        def power(num, se=self._function):
+            try:
+                return math.pow(base, se(num))
+            except ValueError:
+                # A negative base with a fractional exponent or 0 with a negative one
+                return float("nan")
+        def power_array(arr):
+            exponents = self.eval_array(arr)
+            powers = np.power(base, exponents)
+            if base == 0:
+                powers[exponents < 0] = np.nan
+            return powers
+        return _with_node(Function(power, power_array), OP_POW, func_or_num, self)
+
+    def derivative(self, dx=0.0001, mode="exact"):
         """Return a new instance of Function that evaluates to the derivative of this
         function in each point.
 
         Keyword arguments:
         dx --   a real number that determines the step in the two point difference method
                 for calculating derivatives (defaults to 0.0001).
+        mode -- "exact" or "numeric" (defaults to "exact"). Exact derivatives are
+                calculated by the chain rule in the same evaluation as the function
+                itself, this is only possible for functions built from the elementary
+                functions. Other functions use the numeric two point difference method.
 
         Using the two point differential method ensures that the result is as close as O(dx^2).
         """
-        def deriv(num, h=dx):
-            if math.isnan(self.eval(num)):
+        if mode not in ("exact", "numeric"):
+            raise ValueError("mode must be either \"exact\" or \"numeric\".")
+        if mode == "exact" and self._flat_tape() is None:
+            mode = "numeric"
+        if (dx, mode) in self._derivatives:
+            return self._derivatives[(dx, mode)]
+        if mode == "exact":
+            differentiated = _tape_derivative(self._flat_tape())
+            self._derivatives[(dx, mode)] = differentiated
+            return differentiated
+
+        # The kernels generated from the tape evaluate faster than the closures, the
+        # numba kernel is used if it has already been compiled, see jit.
+        if self._njit_kernel:
+            evaluate = self._njit_kernel[0]
+        else:
+            evaluate = self._python_kernel() or self._function
+        def deriv(num, h=dx, inverse_2h=0.5/dx):
+            if math.isnan(evaluate(num)):
                 # Cannot calculate derivative in this point
-                return float("nan")
-
-            f_posh = self.eval(num+h)
-            f_negh = self.eval(num-h)
-
-            # Defaults to the one point difference method if either of the points is
-            # nan. This means we happened to come across a singularity.
-            if math.isnan(f_posh):
-                f_posh = self.eval(num)
-                h = h/2
-            elif math.isnan(f_negh):
-                f_negh = self.eval(num)
-                h = h/2
-            df = f_posh - f_negh
-            return df/(2*h)
-
-        return Function(deriv)
-
-    def integrate(self, start, end, tol=1e-5, MAX=1e10):
+                return math.nan
+            # The two point difference is inlined, _central_difference handles the
+            # points where it is NaN.
+            derivative = (evaluate(num + h) - evaluate(num - h))*inverse_2h
+            if math.isnan(derivative):
+                return _central_difference(evaluate, num, h)
+            return derivative
+
+        def deriv_array(arr, h=dx):
+            f_evals = self.eval_array(arr)
+            f_posh = self.eval_array(arr+h)
+            f_negh = self.eval_array(arr-h)
+
+            # Same fallback to the one point difference method as above but done
+            # for all the points at once.
+            posh_nan = np.isnan(f_posh)
+            negh_nan = np.isnan(f_negh) & ~posh_nan
+            f_posh = np.where(posh_nan, f_evals, f_posh)
+            f_negh = np.where(negh_nan, f_evals, f_negh)
+            steps = np.where(posh_nan | negh_nan, h, 2*h)
+            return np.where(np.isnan(f_evals), np.nan, (f_posh - f_negh)/steps)
+
+        differentiated = Function(deriv, deriv_array)
+        self._derivatives[(dx, mode)] = differentiated
+        return differentiated
+
+    def integrate(self, start, end, tol=1e-5, MAX=1e10, method="adaptive"):
         """Return the definite integral from start to end of this function if it exists.
         Return NaN otherwise.
 
@@ -281,50 +555,168 @@ class Function:
         tol -- The accepted tolerance of the evaluation (defaults to 1e-5).
         MAX --  The maximum value the integral can evaluate to (defaults to 1e10).
                 Is used to prevent diverging integrals from hogging resources.
+        method -- "adaptive" or "tanh-sinh" (defaults to "adaptive"). The tanh-sinh
+                quadrature (see _tanh_sinh) needs far fewer evaluations for functions
+                that are smooth inside the interval, also with singularities at its
+                endpoints, but it cannot integrate around singularities inside it.
 
         The algorithm uses a version of Simpson's 3/8 rule.
         https://en.wikipedia.org/wiki/Simpson%27s_rule#Simpson's_3/8_rule
         https://en.wikipedia.org/wiki/Adaptive_Simpson%27s_method
-        """
-        intervals_to_integrate = [(start, end)]
-        acc_int = 0 # Accumulates the value of the integral
-
-        while intervals_to_integrate:
-            if acc_int > MAX:
-                return float("nan")
-
-            start, end = intervals_to_integrate.pop()
-            # If either endpoint is a singularity it is a generalized integral
-            if math.isnan(self.eval(start)):
-                start += tol**3 # Ensures the tolerance is met
-            if math.isnan(self.eval(end)):
-                end -= tol**3
-
-            midpoint = (start + end)/2
-            left = self._simpsons_rule(start, midpoint)
-            right = self._simpsons_rule(midpoint, end)
-            whole = self._simpsons_rule(start, end)
-
-            if abs(left + right - whole) <= 15*tol:
-                acc_int += left + right + (left + right - whole)/15
-            else:
-                # If the tolerance is not met we divide the interval again
-                intervals_to_integrate.extend([(start, midpoint), (midpoint, end)])
-        return acc_int
 
-    def _simpsons_rule(self, start, end):
-        """Return the calculation of simpson's 3/8 rule on the interval from start
-        to end with this function.
+        If the function is built from the elementary functions integrals that need many
+        evaluations are run as compiled code instead, by the C code of functions
+        returned by compile and otherwise by numba if it is installed. Without numba,
+        and for other functions that can evaluate arrays, all the intervals of the same level of
+        division are evaluated at once by eval_array. Integrals that diverge at start
+        or end are found from a few evaluations near them (see _diverges_at_endpoints).
+        """
+        if method not in ("adaptive", "tanh-sinh"):
+            raise ValueError("method must be either \"adaptive\" or \"tanh-sinh\".")
+        if method == "tanh-sinh":
+            return _tanh_sinh(self.eval_array, start, end, tol, MAX)
+        if _diverges_at_endpoints(self.eval_array, start, end):
+            return math.nan
+        if self._flat_tape() is None:
+            if self._array_function is not None:
+                # Evaluating all the intervals of a level at once is faster
+                return _adaptive_simpson_array(self.eval_array, start, end, tol, MAX)
+            return _adaptive_simpson(self.eval, start, end, tol, MAX, -1)[0]
+
+        # Equal functions share their tapes so integrating them again is looked up
+        return _tape_integral(self, start, end, tol, MAX)
+
+    def integrate_fixed(self, start, end, n=1000):
+        """Return the definite integral from start to end of this function calculated
+        on a fixed grid. Return NaN if the function is not defined in a point of the grid.
 
         Keyword arguments:
         start -- A real number being the startingpoint of the integral.
         end -- A real number being the endpoint of the integral.
+        n -- The positive integer number of pairs of intervals in the grid (defaults to 1000).
+
+        The algorithm uses the composite Simpson's rule on 2n intervals of equal length
+        so the function is evaluated in all the points at once. It is much faster than
+        integrate for smooth functions but gives no guarantee on the error.
+        https://en.wikipedia.org/wiki/Simpson%27s_rule#Composite_Simpson's_1/3_rule
+        """
+        if n < 1:
+            raise ValueError("n must be a positive integer.")
+        f_evals = self.eval_array(np.linspace(start, end, 2*n + 1))
+        weighted_sum = (f_evals[0] + f_evals[-1] + 4*f_evals[1::2].sum()
+                        + 2*f_evals[2:-1:2].sum())
+        return float((end - start)/(6*n) * weighted_sum)
+
+    def _python_kernel(self):
+        """Return the python function generated from the tape of this function (see
+        _tape_source) or None if it is not built from the elementary functions.
+        The kernel is generated on the first call.
+        """
+        if self._py_kernel is None:
+            self._py_kernel = False # Marks that the kernel cannot be built
+            if self._flat_tape() is not None:
+                source = _tape_source(self._flat_tape())
+                if source not in _PYTHON_KERNELS:
+                    namespace = dict(_KERNEL_NAMESPACE)
+                    exec(source, namespace)
+                    _PYTHON_KERNELS[source] = namespace["kernel"]
+                self._py_kernel = _PYTHON_KERNELS[source]
+        return self._py_kernel or None
+
+    def _kernel(self):
+        """Return a numba compiled version of the eval method if it can be built.
+        Return None otherwise.
+        """
+        kernels = self._kernels()
+        if kernels is None:
+            return None
+        return kernels[0]
+
+    def _kernels(self):
+        """Return a tuple of the numba compiled kernel and kernel_array of this
+        function (see _numba_kernels) if they can be built. Return None otherwise.
+        They are only compiled on the first call.
+        """
+        if self._njit_kernel is None:
+            self._njit_kernel = False # Marks that the kernels cannot be built
+            if self._flat_tape() is not None and _numba() is not None:
+                self._njit_kernel = _numba_kernels(_tape_source(self._flat_tape()))
+        return self._njit_kernel or None
+
+    def _flat_tape(self):
+        """Return the tape of this function (see _tape_source) or None if this function
+        is not built from the elementary functions. The tape is built on the first call.
+        """
+        if self._tape is None:
+            self._tape = _build_tape(self) or False
+        return self._tape or None
+
+    def compile(self):
+        """Return a new Function instance that evaluates as this function but runs
+        as compiled C code. Return this function if it cannot be compiled, i.e. if it
+        is not built from the elementary functions or if no C compiler is available.
+
+        The compiled code is cached in ~/.cache/funcmod so each function is only
+        compiled once.
+        """
+        library = self._library()
+        if library is None:
+            return self
+        kernel = library.kernel
+        kernel_array = library.kernel_array
+        def compiled_array(arr):
+            points = np.ascontiguousarray(arr, dtype=float)
+            evals = np.empty_like(points)
+            kernel_array(points.ctypes.data, evals.ctypes.data, points.size)
+            return evals
+        compiled = Function(kernel, compiled_array)
+        compiled._node = self._node
+        compiled._c_kernels = library
+        return compiled
+
+    def _library(self):
+        """Return the ctypes library compiled from the C source of this function
+        (see _tape_c_source) if it can be built. Return None otherwise.
         """
-        return ((end - start)/8
-                * (self.eval(start)
-                + 3*self.eval((2*start + end)/3)
-                + 3*self.eval((start  + 2*end)/3)
-                + self.eval(end)))
+        if self._flat_tape() is None:
+            return None
+        try:
+            library = _c_library(_tape_c_source(self._flat_tape()))
+        except (OSError, subprocess.SubprocessError):
+            return None
+        library.kernel.restype = ctypes.c_double
+        library.kernel.argtypes = [ctypes.c_double]
+        library.kernel_array.restype = None
+        library.kernel_array.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_long]
+        library.adaptive_simpson.restype = ctypes.c_double
+        library.adaptive_simpson.argtypes = [ctypes.c_double]*4 + [ctypes.c_long,
+                                                                   ctypes.POINTER(ctypes.c_int)]
+        return library
+
+    def jit(self):
+        """Return a new Function instance that evaluates as this function but runs
+        as code compiled by numba. Return this function if it cannot be compiled, i.e.
+        if numba is not installed or if it is not built from the elementary functions.
+
+        Arrays with fewer points than _JIT_MIN_ARRAY_SIZE are still evaluated by
+        numpy since calling the compiled code has an overhead. The compiled code is
+        cached in ~/.cache/funcmod so each function is only compiled once.
+        """
+        kernels = self._kernels()
+        if kernels is None:
+            return self
+        kernel, kernel_array = kernels
+        def jitted_array(arr):
+            if arr.size < _JIT_MIN_ARRAY_SIZE:
+                return self.eval_array(arr)
+            points = np.ascontiguousarray(arr, dtype=float).ravel()
+            evals = np.empty_like(points)
+            kernel_array(points, evals)
+            return evals.reshape(arr.shape)
+        jitted = Function(kernel, jitted_array)
+        jitted._node = self._node
+        jitted._njit_kernel = kernels
+        return jitted
 
     def plot(self, start, end, step=0.01):
         """Start a new process that shows the plot of the function from start to end.
@@ -334,6 +726,11 @@ class Function:
         end -- The real number at which the x-axis ends
         step -- A real number for the fineness of the plot (defaults to 0.01)
         """
+        if step <= 0:
+            # Raised here since an error in the new process would go unnoticed
+            raise ValueError("step must be a positive number.")
+        # Imported here since only plotting needs it
+        from multiprocessing import Process
         Process(target=self._plot, args=(start, end, step)).start()
 
     def _plot(self, start, end, step):
@@ -344,35 +741,35 @@ class Function:
         end -- The real number at which the x-axis ends
         step -- A real number for the fineness of the plot
         """
-        grid = self._get_eval_grid(start, end, step)
-        grid = zip(*grid)
+        # Imported here so that importing this module does not load matplotlib
+        import matplotlib.pyplot as plt
+        domain, f_evals = self._get_eval_grid(start, end, step)
         # Removes singularities
-        grid = [point for point in grid if not math.isnan(point[1])]
-        domain, f_evals = zip(*grid)
-        domain, f_evals = list(domain), list(f_evals)
-        plt.plot(domain, f_evals)
+        defined = ~np.isnan(f_evals)
+        plt.plot(domain[defined], f_evals[defined])
         plt.show()
 
     def _get_eval_grid(self, start, end, step):
-        """Return a tuple containing two list, the first being the evaluation points
-        (or the domain) and the second being the functions evaluation in those points
-        (or the codomain).
+        """Return a tuple containing two numpy arrays, the first being the evaluation
+        points (or the domain) and the second being the functions evaluation in those
+        points (or the codomain).
 
         Keyword arguments:
         start -- The real number at which the domain starts
         end -- The real number at which the domain ends
-        step -- A real number for the fineness of the domain points.
+        step -- A real number for the largest distance between the domain points.
 
         Obs! The functions evaluation includes points where the function is not defined
         so some points may be NaN.
         """
-        domain = []
-        curr = start
-        while curr < end:
-            domain.append(curr)
-            curr += step
-        domain.append(end)
-        f_evals = [self.eval(x) for x in domain]
+        if step <= 0:
+            raise ValueError("step must be a positive number.")
+        if start < end:
+            # The points are spread evenly so none of them are further apart than step
+            domain = np.linspace(start, end, math.ceil((end - start)/step) + 1)
+        else:
+            domain = np.array([end], dtype=float)
+        f_evals = self.eval_array(domain)
         return (domain, f_evals)
 
 
@@ -388,38 +785,1306 @@ def norm(func: Function, norm_type="L2", tol=1e-5):
 
     For information about norm types see: https://en.wikipedia.org/wiki/Lp_space#Lp_spaces
     """
-    if norm_type[0] == "L":
+    return norms(func, (norm_type,), tol)[0]
+
+def norms(func: Function, norm_types=("L2",), tol=1e-5):
+    """Return a list of the norms of the provided function, one for each norm type in
+    norm_types, with NaN for the norms that do not exist.
+
+    Keyword arguments:
+    func -- A Function instance to calculate the norms on.
+    norm_types -- A sequence of norm types, see norm (defaults to ("L2",)).
+    tol -- The accepted tolerance of the evaluations (defaults to 1e-5).
+
+    The evaluations that decide whether the norms exist are shared by all of them.
+    """
+    exponents = []
+    for norm_type in norm_types:
+        if norm_type[0] != "L":
+            raise ValueError("Must input a valid norm type. See Documentation or do: help(norm)")
         try:
-            norm_type = int(norm_type[1:])
+            exponents.append(int(norm_type[1:]))
         except ValueError:
             raise ValueError("Must input a valid norm type. See Documentation or do: help(norm)")
 
-        func_to_integrate = abs(func)**norm_type
-        # If the function does not approach 0 in ±infinity the integral diverges
+    samples = None # The absolute values of func far out on the real line
+    results = []
+    for exponent in exponents:
+        func_to_integrate = abs(func)**exponent
+        # If the function does not approach 0 in ±infinity the integral diverges.
+        # When its limits can be told from its tape that is checked without evaluating it.
+        tape = func_to_integrate._flat_tape()
+        if tape is not None and any(isinstance(limit, float) and limit != 0
+                                    for limit in (_tape_limit(tape, 1), _tape_limit(tape, -1))):
+            results.append(float("nan"))
+            continue
         try:
+            if samples is None:
+                samples = [abs(func.eval(num)) for num in (1e5, 1e6, -1e5, -1e6)]
             # Can throw OverflowError if the function diverges
-            cond1 = abs(func_to_integrate.eval(1e5)) >= abs(func_to_integrate.eval(1e6))
-            cond2 = abs(func_to_integrate.eval(-1e5)) >= abs(func_to_integrate.eval(-1e6))
+            evals = [sample**exponent for sample in samples]
+            cond1 = evals[0] >= evals[1]
+            cond2 = evals[2] >= evals[3]
 
             # This is the value of 1/x which is the "smallest" function not to converge
-            cond3 = abs(func_to_integrate.eval(1e5)) < 1e-5
-            cond4 = abs(func_to_integrate.eval(-1e5)) < 1e-5
+            cond3 = evals[0] < 1e-5
+            cond4 = evals[2] < 1e-5
             integrable = cond1 and cond2 and cond3 and cond4
 
         except OverflowError:
             integrable = False
 
         if not integrable:
-            return float("nan")
+            results.append(float("nan"))
+            continue
         # Change variables so that the interval to integrate over is not infinity.
         # https://en.wikipedia.org/wiki/Numerical_integration#Integrals_over_infinite_intervals
-        func_to_integrate = func_to_integrate(x/(1-x**2)) * (1+x**2)/((1-x**2)**2)
-        return (func_to_integrate.integrate(-1, 1, tol=tol))**(1/norm_type)
+        func_to_integrate = func_to_integrate(_SUBSTITUTION) * _SUBSTITUTION_DERIVATIVE
+        results.append((func_to_integrate.integrate(-1, 1, tol=tol))**(1/exponent))
+    return results
+
+def eval_many(funcs, grid):
+    """Return a two dimensional numpy array whose row i is the evaluation of funcs[i]
+    in each point of grid.
+
+    Keyword arguments:
+    funcs -- A list of Function instances.
+    grid -- A one dimensional numpy array of real numbers.
+
+    The functions that are built from the elementary functions are evaluated together
+    so the subexpressions they share are only evaluated once.
+    """
+    evals = np.empty((len(funcs), len(grid)))
+    built = [index for index, func in enumerate(funcs) if func._flat_tape() is not None]
+    if built:
+        tape, results = _build_shared_tape([funcs[index] for index in built])
+        namespace = dict(_ARRAY_KERNEL_NAMESPACE)
+        exec(_tape_source(tape, results), namespace)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            rows = namespace["kernel"](np.asarray(grid, dtype=float))
+        for index, row in zip(built, rows):
+            evals[index] = row
+    for index, func in enumerate(funcs):
+        if func._flat_tape() is None:
+            evals[index] = func.eval_array(grid)
+    return evals
+
+@functools.lru_cache(maxsize=128)
+def _tape_integral(function, start, end, tol, MAX):
+    """Return the definite integral from start to end of function, which is built
+    from the elementary functions. See Function.integrate for the details.
+
+    Keyword arguments:
+    function -- A Function instance with a tape.
+    start -- A real number being the startingpoint of the integral.
+    end -- A real number being the endpoint of the integral.
+    tol -- The accepted tolerance of the evaluation.
+    MAX -- The maximum value the integral can evaluate to.
+
+    The integrals are cached by the arguments. Function instances that are built
+    the same way compare equal so e.g. repeated norms are only integrated once.
+    The cache keeps the last 128 functions that were integrated alive, together
+    with their kernels and compiled libraries.
+    """
+    # The straight-line python kernel evaluates faster than the chain of closures.
+    # Compiling only pays off for integrals that need many evaluations so they
+    # are first tried in python with a limited number of intervals.
+    kernel = function._python_kernel()
+    integral, completed = _adaptive_simpson(kernel, start, end, tol, MAX,
+                                            _PYTHON_MAX_INTERVALS)
+    if completed:
+        return integral
+    if function._njit_kernel:
+        # The function has already been compiled by numba, see Function.jit
+        return _jit_adaptive_simpson()(function._kernel(), float(start), float(end),
+                                       float(tol), float(MAX), -1)[0]
+    if function._c_kernels is not None:
+        # The function has been compiled to C, see Function.compile
+        completed = ctypes.c_int()
+        return function._c_kernels.adaptive_simpson(start, end, tol, MAX, -1,
+                                                    ctypes.byref(completed))
+    if _numba() is not None:
+        # Interpreting the tape saves compiling a kernel for every function
+        interpreter, adaptive_simpson = _jit_interpreter()
+        return adaptive_simpson(interpreter, float(start), float(end), float(tol),
+                                float(MAX), -1, *_tape_arrays(function._flat_tape()))[0]
+    return _adaptive_simpson_array(function.eval_array, start, end, tol, MAX)
+
+def _adaptive_simpson(func, start, end, tol, MAX, max_intervals, *args):
+    """Return a tuple of the definite integral from start to end of func if it
+    exists, NaN otherwise, and whether the integration was completed.
+    See Function.integrate for the details.
+
+    Keyword arguments:
+    func -- A function that takes a real number as input and outputs another.
+    start -- A real number being the startingpoint of the integral.
+    end -- A real number being the endpoint of the integral.
+    tol -- The accepted tolerance of the evaluation.
+    MAX -- The maximum value the integral can evaluate to.
+    max_intervals --    The number of intervals after which the integration is stopped
+                        uncompleted, or a negative number to never stop it.
+    args -- Extra arguments that func is called with after the point.
+
+    This function is also compiled by numba so it may only use what numba supports.
+    """
+    # Every interval carries the evaluations of func in its endpoints and in the two
+    # points that divide it in thirds. These are shared with the halves of the
+    # interval so each interval only needs three new evaluations.
+    third = (end - start)*(1/3)
+    intervals_to_integrate = [(start, end, func(start, *args),
+                               func(start + third, *args), func(end - third, *args),
+                               func(end, *args))]
+    acc_int = 0.0 # Accumulates the value of the integral
+    singularity_step = tol**3 # Ensures the tolerance is met
+    max_error = 15*tol
+
+    while intervals_to_integrate:
+        if acc_int > MAX:
+            return math.nan, True
+        if max_intervals == 0:
+            return acc_int, False
+        max_intervals -= 1
+
+        start, end, f_start, f_third, f_two_thirds, f_end = intervals_to_integrate.pop()
+        # If either endpoint is a singularity it is a generalized integral
+        if math.isnan(f_start) or math.isnan(f_end):
+            if math.isnan(f_start):
+                start += singularity_step
+                f_start = func(start, *args)
+            if math.isnan(f_end):
+                end -= singularity_step
+                f_end = func(end, *args)
+            if math.isnan(f_start) or math.isnan(f_end):
+                # Not a single point but a part of the interval where func is undefined
+                return math.nan, True
+            third = (end - start)*(1/3)
+            f_third = func(start + third, *args)
+            f_two_thirds = func(end - third, *args)
+
+        half = (end - start)*0.5
+        sixth = half*(1/3)
+        midpoint = start + half
+        f_midpoint = func(midpoint, *args)
+        f_sixth = func(start + sixth, *args)
+        f_five_sixths = func(end - sixth, *args)
+        left = _simpsons_rule(half, f_start, f_sixth, f_third, f_midpoint)
+        right = _simpsons_rule(half, f_midpoint, f_two_thirds, f_five_sixths, f_end)
+        whole = _simpsons_rule(half + half, f_start, f_third, f_two_thirds, f_end)
+
+        error = left + right - whole
+        if math.isnan(error) and not math.isnan(f_midpoint):
+            # Only a NaN in the midpoint can be a singularity that is integrated
+            # around, the halves of the interval move it to their endpoints.
+            return math.nan, True
+        # An interval that is too small to be divided again is accepted as it is
+        if abs(error) <= max_error or not start < midpoint < end:
+            acc_int += left + right + error/15
+        else:
+            # If the tolerance is not met we divide the interval again
+            intervals_to_integrate.extend([
+                (start, midpoint, f_start, f_sixth, f_third, f_midpoint),
+                (midpoint, end, f_midpoint, f_two_thirds, f_five_sixths, f_end)])
+    return acc_int, True
+
+def _adaptive_simpson_array(func_array, start, end, tol, MAX):
+    """Return the definite integral from start to end of func_array if it exists,
+    NaN otherwise. This is _adaptive_simpson with all the intervals of the same
+    level of division integrated at once, see Function.integrate for the details.
+
+    Keyword arguments:
+    func_array --   A function that takes a numpy array of real numbers as input and
+                    outputs the evaluation of a function in each of its points.
+    start -- A real number being the startingpoint of the integral.
+    end -- A real number being the endpoint of the integral.
+    tol -- The accepted tolerance of the evaluation.
+    MAX -- The maximum value the integral can evaluate to.
+    """
+    # The columns of the intervals are start, end and the evaluations in start, in
+    # the points that divide the interval in thirds and in end.
+    third = (end - start)*(1/3)
+    points = np.array([start, end, start, start + third, end - third, end], dtype=float)
+    points[2:] = func_array(points[2:])
+    intervals = points.reshape(1, 6)
+    acc_int = 0.0 # Accumulates the value of the integral
+    singularity_step = tol**3 # Ensures the tolerance is met
+    max_error = 15*tol
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        while intervals.size:
+            if acc_int > MAX:
+                return math.nan
+            starts, ends, f_starts, f_thirds, f_two_thirds, f_ends = intervals.T
+            # If either endpoint is a singularity it is a generalized integral
+            singular_starts = np.isnan(f_starts)
+            singular_ends = np.isnan(f_ends)
+            singular = singular_starts | singular_ends
+            if singular.any():
+                starts = np.where(singular_starts, starts + singularity_step, starts)
+                ends = np.where(singular_ends, ends - singularity_step, ends)
+                thirds = (ends - starts)*(1/3)
+                evals = func_array(np.concatenate((
+                    starts[singular], starts[singular] + thirds[singular],
+                    ends[singular] - thirds[singular], ends[singular])))
+                f_starts, f_thirds, f_two_thirds, f_ends = (
+                    np.array(column) for column in (f_starts, f_thirds, f_two_thirds, f_ends))
+                (f_starts[singular], f_thirds[singular], f_two_thirds[singular],
+                 f_ends[singular]) = evals.reshape(4, -1)
+                if np.isnan(f_starts).any() or np.isnan(f_ends).any():
+                    # Not a single point but a part of an interval where func is undefined
+                    return math.nan
+
+            halves = (ends - starts)*0.5
+            sixths = halves*(1/3)
+            midpoints = starts + halves
+            f_midpoints, f_sixths, f_five_sixths = func_array(np.concatenate(
+                (midpoints, starts + sixths, ends - sixths))).reshape(3, -1)
+            lefts = _simpsons_rule(halves, f_starts, f_sixths, f_thirds, f_midpoints)
+            rights = _simpsons_rule(halves, f_midpoints, f_two_thirds, f_five_sixths, f_ends)
+            wholes = _simpsons_rule(halves + halves, f_starts, f_thirds, f_two_thirds, f_ends)
+
+            errors = lefts + rights - wholes
+            if (np.isnan(errors) & ~np.isnan(f_midpoints)).any():
+                # Only a NaN in the midpoint can be a singularity that is integrated
+                # around, the halves of the interval move it to their endpoints.
+                return math.nan
+            # Intervals that are too small to be divided again are accepted as they are
+            accepted = ((np.abs(errors) <= max_error) | (starts >= midpoints)
+                        | (midpoints >= ends))
+            acc_int += float(np.sum(lefts[accepted] + rights[accepted]
+                                    + errors[accepted]/15))
+            # The intervals that do not meet the tolerance are divided again
+            divided = ~accepted
+            intervals = np.concatenate((
+                np.column_stack((starts, midpoints, f_starts, f_sixths, f_thirds,
+                                 f_midpoints))[divided],
+                np.column_stack((midpoints, ends, f_midpoints, f_two_thirds,
+                                 f_five_sixths, f_ends))[divided]))
+    return acc_int
+
+def _tanh_sinh(func_array, start, end, tol, MAX):
+    """Return the definite integral from start to end of func_array by the tanh-sinh
+    quadrature if it exists, NaN otherwise. See Function.integrate for the details.
+
+    Keyword arguments:
+    func_array --   A function that takes a numpy array of real numbers as input and
+                    outputs the evaluation of a function in each of its points.
+    start -- A real number being the startingpoint of the integral.
+    end -- A real number being the endpoint of the integral.
+    tol -- The accepted tolerance of the evaluation.
+    MAX -- The maximum value the integral can evaluate to.
+
+    The points t of a grid with step h are mapped to the interval by
+    x = mid + half*tanh(pi/2*sinh(t)), which crowds them towards the endpoints so
+    singularities there are integrated without being evaluated. Halving h doubles
+    the points until the estimate changes by at most tol.
+    https://en.wikipedia.org/wiki/Tanh-sinh_quadrature
+    """
+    half = (end - start)*0.5
+    def weighted_sum(ts):
+        # 1 - tanh(u) is calculated directly so the points near the endpoints keep
+        # their precision.
+        u = math.pi*0.5*np.sinh(ts)
+        with np.errstate(over="ignore"):
+            distances = half*2/(np.exp(2*u) + 1)
+            weights = half*math.pi*0.5*np.cosh(ts)/np.cosh(u)**2
+        points = np.concatenate((start + distances, end - distances))
+        # Points that are rounded to the endpoints are left out, their weights vanish
+        inside = (points != start) & (points != end)
+        evals = np.zeros_like(points)
+        evals[inside] = func_array(points[inside])
+        weighted = np.concatenate((weights, weights))*evals
+        return float(weighted.sum())
+
+    step = 1.0
+    # The weights are below 1e-30 for |t| > 4 so the grid is cut off there
+    estimate = step*weighted_sum(np.arange(step, 4 + step, step))
+    estimate += step*half*math.pi*0.5*float(func_array(np.array([start + half]))[0])
+    for _ in range(_TANH_SINH_LEVELS):
+        if math.isnan(estimate) or abs(estimate) > MAX:
+            return math.nan
+        step *= 0.5
+        # The points of the finer grid that are new are the odd multiples of step
+        refined = estimate*0.5 + step*weighted_sum(np.arange(step, 4, 2*step))
+        if abs(refined - estimate) <= tol:
+            return refined
+        estimate = refined
+    return math.nan # Does not converge, e.g. the integral diverges
+
+def _simpsons_rule(length, f_start, f_third, f_two_thirds, f_end):
+    """Return the calculation of simpson's 3/8 rule on an interval given the
+    evaluations of the function in the points of the rule.
+
+    Keyword arguments:
+    length -- The length of the interval, i.e. end - start.
+    f_start -- The evaluation in the startingpoint of the interval.
+    f_third -- The evaluation in the point a third of the way from start to end.
+    f_two_thirds -- The evaluation in the point two thirds of the way from start to end.
+    f_end -- The evaluation in the endpoint of the interval.
+    """
+    return length*0.125 * (f_start + f_end + 3*(f_third + f_two_thirds))
+
+def _diverges_at_endpoints(func_array, start, end):
+    """Return True if func_array is not defined near start or end or grows at least as
+    fast as 1/(x - c) towards one of them, so the integral from start to end diverges.
+
+    Keyword arguments:
+    func_array --   A function that takes a numpy array of real numbers as input and
+                    outputs the evaluation of a function in each of its points.
+    start -- A real number being the startingpoint of the integral.
+    end -- A real number being the endpoint of the integral.
+
+    The function is evaluated at once in points at geometrically shrinking distances
+    d to the endpoints. If d*|f| never decreases as d goes to zero the integrand is
+    not integrable there, which the adaptive integration would otherwise only find
+    after dividing the interval down to the smallest intervals.
+    """
+    length = end - start
+    if length == 0 or not math.isfinite(length):
+        return False
+    distances = abs(length)*_ENDPOINT_DISTANCES
+    points = np.concatenate((start + length*_ENDPOINT_DISTANCES,
+                             end - length*_ENDPOINT_DISTANCES))
+    with np.errstate(all="ignore"):
+        evals = np.abs(np.asarray(func_array(points), dtype=float))
+        if np.isnan(evals).any():
+            return True
+        for scaled in np.split(np.tile(distances, 2)*evals, 2):
+            # Small rounding errors are allowed for integrands like 1/x where d*|f|
+            # is constant
+            if scaled[0] > 0 and (scaled[:-1] >= scaled[1:]*(1 - 1e-9)).all():
+                return True
+    return False
+
+# The distances to the endpoints, relative to the length of the interval, where
+# _diverges_at_endpoints samples the function
+_ENDPOINT_DISTANCES = np.geomspace(1e-12, 1e-4, 17)
+# The number of times the step of _tanh_sinh is halved before it gives up
+_TANH_SINH_LEVELS = 12
+# The number of intervals integrated in python before switching to compiled code
+_PYTHON_MAX_INTERVALS = 2000
+_PYTHON_KERNELS = {} # The python kernels by their source, see Function._python_kernel
+_NJIT_KERNELS = {} # The compiled numba kernels by their source, see _numba_kernels
+_JIT_MIN_ARRAY_SIZE = 1000 # The smallest arrays that are evaluated by numba, see Function.jit
+# The module that is compiled by numba for each kernel source
+_NUMBA_MODULE = """import numba
+
+@numba.njit("float64(float64)", cache=True)
+{source}
+
+@numba.njit("void(float64[::1], float64[::1])", cache=True)
+def kernel_array(xs, evals):
+    for i in range(xs.size):
+        evals[i] = kernel(xs[i])
+"""
+
+def _numba_kernels(source):
+    """Return a tuple of the kernel with the python source code source compiled by
+    numba and kernel_array, its vectorized version that writes the evaluations of
+    an array xs to the array evals. Return False if they cannot be compiled.
+
+    Keyword arguments:
+    source -- The source code of a python function named kernel, see _tape_source.
+
+    The kernels are written as modules to ~/.cache/funcmod (see _cache_dir) so numba
+    can cache the compiled code between runs. Equal sources share their kernels.
+    """
+    numba = _numba()
+    if source not in _NJIT_KERNELS:
+        module_source = _NUMBA_MODULE.format(source=source)
+        name = "funcmod_" + hashlib.sha1(module_source.encode()).hexdigest()
+        try:
+            module_path = os.path.join(_cache_dir(), name + ".py")
+            if not os.path.exists(module_path):
+                _write_atomically(module_path, module_source)
+            spec = importlib.util.spec_from_file_location(name, module_path)
+            module = importlib.util.module_from_spec(spec)
+            module.__dict__.update(_KERNEL_NAMESPACE)
+            # numba finds the module by its name when it loads the cached code
+            sys.modules[name] = module
+            spec.loader.exec_module(module)
+            _NJIT_KERNELS[source] = (module.kernel, module.kernel_array)
+        except (OSError, numba.core.errors.NumbaError):
+            _NJIT_KERNELS[source] = False
+    return _NJIT_KERNELS[source]
+
+def _central_difference(func, num, h):
+    """Return the derivative of func in num by the two point difference method with
+    the step h, or by the one point difference method if either of the points is not
+    defined. Return NaN if func is not defined in num.
+
+    Keyword arguments:
+    func -- A function that takes a real number as input and outputs another.
+    num -- The real number to differentiate in.
+    h -- A real number, the step of the difference method.
+    """
+    f_num = func(num)
+    if math.isnan(f_num):
+        # Cannot calculate derivative in this point
+        return math.nan
+    # NaN propagates through the difference so the one point difference
+    # method is only needed when the result is NaN.
+    derivative = (func(num + h) - func(num - h))/(2*h)
+    if not math.isnan(derivative):
+        return derivative
+    f_posh = func(num + h)
+    if math.isnan(f_posh):
+        return (f_num - func(num - h))/h
+    return (f_posh - f_num)/h
+
+_NUMBA = None # The numba module or False if it is not installed, see _numba
+def _numba():
+    """Return the numba module or None if it is not installed. It is imported on the
+    first call since importing numba takes longer than importing this module.
+    """
+    global _NUMBA
+    if _NUMBA is None:
+        try:
+            import numba # Used to compile elementary functions and their integrals
+        except ImportError:
+            _NUMBA = False
+        else:
+            # Lets the compiled kernels and integrator call these helper functions
+            for helper in (_simpsons_rule, _div, _log, _pow, _sign, _defined):
+                numba.extending.register_jitable(helper)
+            _NUMBA = numba
+    return _NUMBA or None
+
+_JIT_ADAPTIVE_SIMPSON = None
+def _jit_adaptive_simpson():
+    """Return _adaptive_simpson compiled by numba for integrating numba kernels.
+    It is compiled on the first call and cached on disk between runs.
+    """
+    global _JIT_ADAPTIVE_SIMPSON
+    if _JIT_ADAPTIVE_SIMPSON is None:
+        numba = _numba()
+        float64 = numba.types.float64
+        kernel_type = numba.types.FunctionType(float64(float64))
+        result_type = numba.types.Tuple((float64, numba.types.boolean))
+        signature = result_type(kernel_type, float64, float64, float64, float64,
+                                numba.types.int64, numba.types.Tuple(()))
+        _JIT_ADAPTIVE_SIMPSON = numba.njit(signature, cache=True)(_adaptive_simpson)
+    return _JIT_ADAPTIVE_SIMPSON
+
+def _tape_arrays(tape):
+    """Return the records of tape (see _tape_source) as a tuple of numpy arrays, the
+    op codes, the lefts, the rights and the values, followed by an array for the values
+    of the records to be written to by _interpret_tape.
+
+    Keyword arguments:
+    tape -- A tape as described in _tape_source.
+
+    The right of an OP_LEAF record is the code of its function in _LEAF_CODES.
+    """
+    ops = np.array([record[0] for record in tape], dtype=np.int64)
+    lefts = np.array([record[1] for record in tape], dtype=np.int64)
+    rights = np.array([_LEAF_CODES[value] if op == OP_LEAF else right
+                       for op, left, right, value in tape], dtype=np.int64)
+    values = np.array([value if op == OP_CONST else 0.0
+                       for op, left, right, value in tape], dtype=np.float64)
+    return ops, lefts, rights, values, np.empty(len(tape))
+
+def _interpret_tape(num, ops, lefts, rights, values, results):
+    """Return the evaluation in num of the tape with the arrays given by _tape_arrays.
+
+    Keyword arguments:
+    num -- A real number
+    ops, lefts, rights, values, results -- The arrays returned by _tape_arrays.
+
+    This function is compiled by numba once for all tapes, unlike the kernels which
+    are compiled for each tape, so it may only use what numba supports.
+    """
+    for i in range(ops.size):
+        op = ops[i]
+        if op == OP_VAR:
+            result = num
+        elif op == OP_CONST:
+            result = values[i]
+        else:
+            left = results[lefts[i]]
+            if op == OP_LEAF:
+                code = rights[i]
+                if code == 0:
+                    result = math.exp(left)
+                elif code == 1:
+                    result = _log(left)
+                elif code == 2:
+                    result = math.sin(left)
+                elif code == 3:
+                    result = math.asin(left)
+                elif code == 4:
+                    result = math.cos(left)
+                elif code == 5:
+                    result = math.acos(left)
+                elif code == 6:
+                    result = math.tan(left)
+                elif code == 7:
+                    result = math.atan(left)
+                elif code == 8:
+                    result = math.sqrt(left)
+                else:
+                    result = _sign(left)
+            elif op == OP_NEG:
+                result = -left
+            elif op == OP_ABS:
+                result = abs(left)
+            else:
+                right = results[rights[i]]
+                if op == OP_ADD:
+                    result = left + right
+                elif op == OP_SUB:
+                    result = left - right
+                elif op == OP_MUL:
+                    result = left * right
+                elif op == OP_DIV:
+                    result = _div(left, right)
+                elif op == OP_POW:
+                    result = _pow(left, right)
+                else: # OP_DEFINED
+                    result = _defined(left, right)
+        results[i] = result
+    return results[ops.size - 1]
+
+_JIT_INTERPRETER = None
+def _jit_interpreter():
+    """Return a tuple of _interpret_tape and _adaptive_simpson compiled by numba for
+    integrating tapes through _interpret_tape. They are compiled on the first call and
+    cached on disk between runs.
+    """
+    global _JIT_INTERPRETER
+    if _JIT_INTERPRETER is None:
+        numba = _numba()
+        float64 = numba.types.float64
+        arrays = (numba.types.int64[::1],)*3 + (float64[::1],)*2
+        interpreter_signature = float64(float64, *arrays)
+        interpreter_type = numba.types.FunctionType(interpreter_signature)
+        result_type = numba.types.Tuple((float64, numba.types.boolean))
+        signature = result_type(interpreter_type, float64, float64, float64, float64,
+                                numba.types.int64, numba.types.Tuple(arrays))
+        _JIT_INTERPRETER = (numba.njit(interpreter_signature, cache=True)(_interpret_tape),
+                            numba.njit(signature, cache=True)(_adaptive_simpson))
+    return _JIT_INTERPRETER
+
+# The operation codes of the records on a tape
+(OP_VAR, OP_CONST, OP_LEAF, OP_NEG, OP_ABS, OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_POW, OP_COMPOSE,
+ OP_DEFINED) = range(12)
+
+# How the records of a tape are written in the python and C kernels, see _tape_statements
+_PYTHON_FORMATS = {
+    OP_VAR: "x", OP_LEAF: "{value}(v{left})", OP_NEG: "-v{left}", OP_ABS: "abs(v{left})",
+    OP_ADD: "v{left} + v{right}", OP_SUB: "v{left} - v{right}", OP_MUL: "v{left} * v{right}",
+    # Division by zero evaluates to NaN as it does for the Function instances
+    OP_DIV: "_div(v{left}, v{right})", OP_POW: "_pow(v{left}, v{right})",
+    OP_DEFINED: "_defined(v{left}, v{right})"
+    }
+# The constant exponents of the powers that are written as products in the kernels,
+# see _multiplied_power. Larger powers are faster with pow.
+_MULTIPLIED_POWERS = frozenset(float(exponent) for exponent in range(2, 17))
+_C_FORMATS = dict(_PYTHON_FORMATS)
+_C_FORMATS.update({OP_ABS: "fabs(v{left})"})
+_C_PRELUDE = """#include <math.h>
+static double _div(double numerator, double denominator) {
+    return denominator == 0.0 ? NAN : numerator / denominator;
+}
+static double _log(double num) {
+    return num <= 0.0 ? NAN : log(num);
+}
+static double _pow(double base, double exponent) {
+    return base == 0.0 && exponent < 0.0 ? NAN : pow(base, exponent);
+}
+static double _sign(double num) {
+    return num > 0.0 ? 1.0 : (num < 0.0 ? -1.0 : 0.0);
+}
+static double _defined(double value, double derivative) {
+    return isnan(value) ? NAN : derivative;
+}"""
+_C_ARRAY_KERNEL = """void kernel_array(const double *xs, double *evals, long n) {
+    #pragma omp simd
+    for (long i = 0; i < n; i++) {
+        evals[i] = kernel(xs[i]);
+    }
+}"""
+
+# The same algorithm as _adaptive_simpson, see there for the details
+_C_ADAPTIVE_SIMPSON = """#include <stdlib.h>
+typedef struct {
+    double start, end, f_start, f_third, f_two_thirds, f_end;
+} interval;
+
+static double simpsons_rule(double length, double f_start, double f_third,
+                            double f_two_thirds, double f_end) {
+    return length*0.125 * (f_start + f_end + 3*(f_third + f_two_thirds));
+}
+
+double adaptive_simpson(double start, double end, double tol, double max,
+                        long max_intervals, int *completed) {
+    long capacity = 64, size = 1;
+    interval *intervals = malloc(capacity*sizeof(interval));
+    double third = (end - start)*(1.0/3.0);
+    double acc_int = 0.0, singularity_step = pow(tol, 3.0), max_error = 15*tol;
+    *completed = 1;
+    if (intervals == NULL) {
+        return NAN;
+    }
+    intervals[0] = (interval){start, end, kernel(start), kernel(start + third),
+                              kernel(end - third), kernel(end)};
+
+    while (size > 0) {
+        if (acc_int > max) {
+            acc_int = NAN;
+            break;
+        }
+        if (max_intervals == 0) {
+            *completed = 0;
+            break;
+        }
+        max_intervals -= 1;
+
+        interval current = intervals[--size];
+        if (isnan(current.f_start) || isnan(current.f_end)) {
+            if (isnan(current.f_start)) {
+                current.start += singularity_step;
+                current.f_start = kernel(current.start);
+            }
+            if (isnan(current.f_end)) {
+                current.end -= singularity_step;
+                current.f_end = kernel(current.end);
+            }
+            if (isnan(current.f_start) || isnan(current.f_end)) {
+                acc_int = NAN;
+                break;
+            }
+            third = (current.end - current.start)*(1.0/3.0);
+            current.f_third = kernel(current.start + third);
+            current.f_two_thirds = kernel(current.end - third);
+        }
+
+        double half = (current.end - current.start)*0.5;
+        double sixth = half*(1.0/3.0);
+        double midpoint = current.start + half;
+        double f_midpoint = kernel(midpoint);
+        double f_sixth = kernel(current.start + sixth);
+        double f_five_sixths = kernel(current.end - sixth);
+        double left = simpsons_rule(half, current.f_start, f_sixth, current.f_third, f_midpoint);
+        double right = simpsons_rule(half, f_midpoint, current.f_two_thirds, f_five_sixths,
+                                     current.f_end);
+        double whole = simpsons_rule(half + half, current.f_start, current.f_third,
+                                     current.f_two_thirds, current.f_end);
+
+        double error = left + right - whole;
+        if (isnan(error) && !isnan(f_midpoint)) {
+            acc_int = NAN;
+            break;
+        }
+        if (fabs(error) <= max_error || !(current.start < midpoint && midpoint < current.end)) {
+            acc_int += left + right + error/15;
+        } else {
+            if (size + 2 > capacity) {
+                interval *grown = realloc(intervals, 2*capacity*sizeof(interval));
+                if (grown == NULL) {
+                    acc_int = NAN;
+                    break;
+                }
+                intervals = grown;
+                capacity *= 2;
+            }
+            intervals[size++] = (interval){current.start, midpoint, current.f_start, f_sixth,
+                                           current.f_third, f_midpoint};
+            intervals[size++] = (interval){midpoint, current.end, f_midpoint,
+                                           current.f_two_thirds, f_five_sixths, current.f_end};
+        }
+    }
+    free(intervals);
+    return acc_int;
+}"""
+
+_NUMBER_TYPES = (float, int)
+
+def _is_number(obj):
+    """Return whether obj is a number, checking the common types before the Number ABC.
+
+    Keyword arguments:
+    obj -- Any object
+    """
+    return type(obj) in _NUMBER_TYPES or isinstance(obj, Number)
+
+# The Function instances built by the operations of the Function class by _node_key,
+# so building the same function twice returns the same instance.
+_INTERNED = weakref.WeakValueDictionary()
+
+def _node_key(op_code, operands):
+    """Return the key of op_code applied on operands in _INTERNED.
+
+    Keyword arguments:
+    op_code -- One of the OP_* codes.
+    operands -- A tuple of Function instances OR real numbers.
+
+    The Function instances are keyed by their id, which stays valid as long as the
+    interned function that uses them is alive.
+    """
+    # The repr tells apart numbers like 0.0 and -0.0 that are equal but do not
+    # give the same function.
+    return (op_code,) + tuple(id(operand) if isinstance(operand, Function)
+                              else (type(operand), repr(operand)) for operand in operands)
+
+def _interned(op_code, *operands):
+    """Return the Function instance that is op_code applied on operands if it has
+    already been built and is still alive. Return None otherwise.
+
+    Keyword arguments:
+    op_code -- One of the OP_* codes.
+    operands -- Instances of Function OR real numbers, see _with_node.
+    """
+    return _INTERNED.get(_node_key(op_code, operands))
+
+def _with_node(function, op_code, *operands):
+    """Record that the Function instance function is op_code applied on operands
+    and return function. The function is also interned so it is returned by
+    _interned.
+
+    Keyword arguments:
+    function -- A Function instance.
+    op_code -- One of the OP_* codes, except OP_VAR, OP_CONST and OP_LEAF.
+    operands -- One (for OP_NEG and OP_ABS) or two instances of Function OR real numbers.
+                For OP_COMPOSE the first operand is evaluated in the second.
+    """
+    function._node = (op_code, operands, None)
+    _INTERNED[_node_key(op_code, operands)] = function
+    return function
+
+def _build_tape(function):
+    """Return the tape of the Function instance function or None if it is not built
+    from the elementary functions.
+
+    Keyword arguments:
+    function -- A Function instance.
+    """
+    shared_tape = _build_shared_tape([function])
+    if shared_tape is None:
+        return None
+    tape, (result,) = shared_tape
+    # The result of function can be a record that was already on the tape, the
+    # records after it are then not needed to compute it.
+    return tape[:result + 1]
+
+def _build_shared_tape(functions):
+    """Return a tuple of a tape that evaluates all the Function instances in functions
+    and a list of the positions of their results on it. Return None if any of them is
+    not built from the elementary functions.
+
+    Keyword arguments:
+    functions -- A list of Function instances.
+
+    Records that are equal are only put once on the tape, so common subexpressions
+    are only evaluated once. The functions are walked without recursion so deeply
+    built functions do not hit the recursion limit.
+    """
+    tape = []
+    positions = {} # The position of each record on the tape
+    def position_of(record):
+        if record not in positions:
+            positions[record] = len(tape)
+            tape.append(record)
+        return positions[record]
+
+    # The position of the result of each (function, position of its variable)
+    results = {}
+    var_position = position_of((OP_VAR, -1, -1, None))
+    to_visit = [(function, var_position) for function in reversed(functions)]
+    while to_visit:
+        current, var_position = to_visit[-1]
+        key = (id(current), var_position)
+        if key in results:
+            to_visit.pop()
+            continue
+        if current._node is None:
+            return None
+        op_code, operands, value = current._node
+
+        if op_code == OP_VAR:
+            results[key] = var_position
+        elif op_code == OP_LEAF:
+            results[key] = position_of((OP_LEAF, var_position, -1, value))
+        elif op_code == OP_COMPOSE:
+            outer, inner = operands
+            inner_key = (id(inner), var_position)
+            if inner_key not in results:
+                to_visit.append((inner, var_position))
+                continue
+            outer_key = (id(outer), results[inner_key])
+            if outer_key not in results:
+                to_visit.append((outer, results[inner_key]))
+                continue
+            results[key] = results[outer_key]
+        else:
+            unvisited = [(operand, var_position) for operand in operands
+                         if isinstance(operand, Function)
+                         and (id(operand), var_position) not in results]
+            if unvisited:
+                to_visit.extend(unvisited)
+                continue
+            arguments = []
+            for operand in operands:
+                if isinstance(operand, Function):
+                    arguments.append(results[(id(operand), var_position)])
+                elif isinstance(operand, (int, float)):
+                    try:
+                        constant = float(operand)
+                    except OverflowError:
+                        # An int too large for a float cannot be on a tape
+                        return None
+                    arguments.append(position_of((OP_CONST, -1, -1, constant)))
+                else:
+                    return None
+            arguments.append(-1)
+            results[key] = position_of((op_code, arguments[0], arguments[1], None))
+        to_visit.pop()
+    return tape, [results[(id(function), var_position)] for function in functions]
+
+def _tape_source(tape, results=None):
+    """Return the source code of a python function named kernel that evaluates tape.
+
+    Keyword arguments:
+    tape -- A list of records (op_code, left, right, value). Each record computes
+            one value from the values of the records at the positions left and
+            right (-1 if unused) and the last record computes the function value.
+            OP_VAR is the variable x, OP_CONST is the number value and OP_LEAF
+            applies the elementary function named value in _KERNEL_NAMESPACE.
+    results --  A list of positions on the tape. If it is given the kernel returns a
+                tuple of their values instead (defaults to None).
+
+    The source evaluates every record exactly once, in order.
+    """
+    lines = ["def kernel(x):"]
+    for statement in _tape_statements(tape, _PYTHON_FORMATS, repr):
+        lines.append("    " + statement)
+    if results is None:
+        lines.append("    return v%d" % (len(tape) - 1))
+    else:
+        lines.append("    return (%s,)" % ", ".join("v%d" % result for result in results))
+    return "\n".join(lines)
+
+def _tape_derivative(tape):
+    """Return a Function instance that evaluates the derivative of tape (see _tape_source).
+
+    Keyword arguments:
+    tape -- A tape as described in _tape_source.
+
+    The derivative is built from the elementary functions by the chain rule so it
+    has a tape itself and can be compiled or differentiated again. It evaluates
+    by the kernels of its tape, which evaluate every common subexpression once.
+    """
+    # Numbers are only combined with functions when they are not 0 or 1
+    def add(left, right):
+        if isinstance(left, float) and left == 0:
+            return right
+        if isinstance(right, float) and right == 0:
+            return left
+        return left + right
+    def subtract(left, right):
+        if isinstance(left, float) and left == 0:
+            return -right
+        return add(left, -right) if isinstance(right, float) else left - right
+    def multiply(left, right):
+        if isinstance(left, float) and isinstance(right, float):
+            return left * right
+        if isinstance(left, float) and left == 0 or isinstance(right, float) and right == 0:
+            return 0.0
+        return left * right
+    def divide(left, right):
+        if isinstance(left, float) and isinstance(right, float):
+            return _div(left, right)
+        if isinstance(left, float) and left == 0:
+            return 0.0
+        return left / right
+
+    values = [] # The Function instance or number that each record evaluates
+    derivatives = [] # The derivative of each record as a Function instance or number
+    for op, left, right, value in tape:
+        if op == OP_VAR:
+            function, derivative = x, 1.0
+        elif op == OP_CONST:
+            function, derivative = value, 0.0
+        elif op == OP_LEAF:
+            function = _LEAF_FUNCTIONS[value](values[left])
+            derivative = multiply(_LEAF_DERIVATIVES[value](values[left], function),
+                                  derivatives[left])
+        elif op == OP_NEG:
+            function, derivative = -values[left], -derivatives[left]
+        elif op == OP_ABS:
+            function = abs(values[left])
+            derivative = multiply(_signum(values[left]), derivatives[left])
+        elif op == OP_ADD:
+            function = values[left] + values[right]
+            derivative = add(derivatives[left], derivatives[right])
+        elif op == OP_SUB:
+            function = values[left] - values[right]
+            derivative = subtract(derivatives[left], derivatives[right])
+        elif op == OP_MUL:
+            function = values[left] * values[right]
+            derivative = add(multiply(derivatives[left], values[right]),
+                             multiply(values[left], derivatives[right]))
+        elif op == OP_DIV:
+            function = values[left] / values[right]
+            if isinstance(values[right], float):
+                derivative = divide(derivatives[left], values[right])
+            else:
+                derivative = divide(subtract(multiply(derivatives[left], values[right]),
+                                             multiply(values[left], derivatives[right])),
+                                    values[right]**2)
+        elif op == OP_POW:
+            function = values[left] ** values[right]
+            if isinstance(values[right], float):
+                # Powers by constants are also defined for bases that are not positive
+                derivative = multiply(multiply(values[right], values[left]**(values[right] - 1)),
+                                      derivatives[left])
+            elif isinstance(values[left], float):
+                derivative = multiply(multiply(function, _log(values[left])), derivatives[right])
+            else:
+                derivative = multiply(function, add(
+                    multiply(derivatives[right], log(values[left])),
+                    divide(multiply(values[right], derivatives[left]), values[left])))
+        else: # OP_DEFINED
+            function = _defined_function(values[left], values[right])
+            derivative = _defined_function(values[left], derivatives[right])
+        values.append(function)
+        derivatives.append(derivative)
+
+    # The derivative is not defined where the function itself is not
+    derivative = _defined_function(values[-1], derivatives[-1])
+    source = _tape_source(derivative._flat_tape())
+    namespace = dict(_KERNEL_NAMESPACE)
+    exec(source, namespace)
+    array_namespace = dict(_ARRAY_KERNEL_NAMESPACE)
+    exec(source, array_namespace)
+    kernel_array = array_namespace["kernel"]
+    def deriv_array(arr):
+        # The derivatives of constant parts are numbers and not arrays
+        derivatives = np.empty(arr.shape)
+        derivatives[...] = kernel_array(arr)
+        return derivatives
+    differentiated = Function(namespace["kernel"], deriv_array)
+    differentiated._node = derivative._node
+    return differentiated
+
+def _defined_function(function, derivative):
+    """Return a Function instance that evaluates as derivative where function is
+    defined and as NaN where it is not.
+
+    Keyword arguments:
+    function -- A Function instance.
+    derivative -- A Function instance OR a real number.
+    """
+    interned = _interned(OP_DEFINED, function, derivative)
+    if interned is not None:
+        return interned
+    if isinstance(derivative, Function):
+        def defined(num, fe=function._function, de=derivative._function):
+            return _defined(fe(num), de(num))
+        def defined_array(arr):
+            return np.where(np.isnan(function.eval_array(arr)), np.nan,
+                            derivative.eval_array(arr))
     else:
-        raise ValueError("Must input a valid norm type. See Documentation or do: help(norm)")
+        def defined(num, fe=function._function):
+            return _defined(fe(num), derivative)
+        def defined_array(arr):
+            return np.where(np.isnan(function.eval_array(arr)), np.nan, derivative)
+    return _with_node(Function(defined, defined_array), OP_DEFINED, function, derivative)
+
+def _tape_limit(tape, direction):
+    """Return the limit of tape (see _tape_source) as x goes to direction * infinity.
+    The limit is a float (possibly ±inf), _BOUNDED if the function stays bounded
+    without a known limit, or None if it cannot be told from the records alone.
+
+    Keyword arguments:
+    tape -- A tape as described in _tape_source.
+    direction -- 1 for +infinity or -1 for -infinity.
+
+    Every record is assumed to be continuous at the finite limits of its operands,
+    which is why _sign and division are only followed where they are.
+    """
+    def real(num):
+        return None if math.isnan(num) else num
+    def finite(limit):
+        return isinstance(limit, float) and math.isfinite(limit)
+
+    limits = []
+    for op, left, right, value in tape:
+        a = limits[left] if left >= 0 else None
+        b = limits[right] if right >= 0 else None
+        limit = None
+        if op == OP_VAR:
+            limit = direction * math.inf
+        elif op == OP_CONST:
+            limit = value
+        elif a is None or op not in (OP_LEAF, OP_NEG, OP_ABS) and b is None:
+            pass
+        elif op == OP_DEFINED:
+            limit = b
+        elif a is _BOUNDED or b is _BOUNDED:
+            other = b if a is _BOUNDED else a
+            if op in (OP_NEG, OP_ABS):
+                limit = _BOUNDED
+            elif op == OP_LEAF:
+                if value in ("exp", "sin", "cos", "atan", "_sign"):
+                    limit = _BOUNDED
+            elif op in (OP_ADD, OP_SUB):
+                limit = other if isinstance(other, float) and math.isinf(other) else _BOUNDED
+            elif op == OP_MUL:
+                if other == 0:
+                    limit = 0.0 # Bounded times something that goes to 0
+                elif other is _BOUNDED or finite(other):
+                    limit = _BOUNDED
+            elif op == OP_DIV:
+                if a is _BOUNDED and finite(b) and b != 0:
+                    limit = _BOUNDED
+                elif a is _BOUNDED and isinstance(b, float) and math.isinf(b):
+                    limit = 0.0
+            elif op == OP_POW:
+                if a is _BOUNDED and finite(b) and b > 0 and b.is_integer():
+                    limit = _BOUNDED
+        else:
+            try:
+                if op == OP_LEAF:
+                    if value == "_sign" and a == 0:
+                        pass # The sign is not continuous at 0
+                    elif value in ("sin", "cos") and math.isinf(a):
+                        limit = _BOUNDED
+                    elif value != "tan" or math.isfinite(a):
+                        limit = real(_KERNEL_NAMESPACE[value](a))
+                elif op == OP_NEG:
+                    limit = -a
+                elif op == OP_ABS:
+                    limit = abs(a)
+                elif op == OP_ADD:
+                    limit = real(a + b)
+                elif op == OP_SUB:
+                    limit = real(a - b)
+                elif op == OP_MUL:
+                    limit = real(a * b)
+                elif op == OP_DIV:
+                    if b != 0:
+                        limit = real(a / b)
+                elif op == OP_POW:
+                    if (a == 1 and math.isinf(b) or math.isinf(a) and b == 0
+                            or a == 0 and b == 0):
+                        pass # Indeterminate forms
+                    elif a > 0 or a < 0 and b.is_integer() or a == 0 and b > 0:
+                        limit = real(math.pow(a, b))
+            except (ValueError, OverflowError):
+                limit = None
+        limits.append(limit)
+    return limits[-1]
+
+def _tape_c_source(tape):
+    """Return the source code of a C library that evaluates tape (see _tape_source).
+
+    Keyword arguments:
+    tape -- A tape as described in _tape_source.
+
+    The library defines "double kernel(double x)", the vectorized version
+    "void kernel_array(const double *xs, double *evals, long n)" and
+    "double adaptive_simpson(double start, double end, double tol, double max,
+    long max_intervals, int *completed)" which integrates kernel as _adaptive_simpson.
+    """
+    lines = [_C_PRELUDE, "double kernel(double x) {"]
+    for statement in _tape_statements(tape, _C_FORMATS, _c_constant):
+        lines.append("    double " + statement + ";")
+    lines.append("    return v%d;" % (len(tape) - 1))
+    lines.append("}")
+    lines.append(_C_ARRAY_KERNEL)
+    lines.append(_C_ADAPTIVE_SIMPSON)
+    return "\n".join(lines)
+
+def _tape_statements(tape, formats, constant_format):
+    """Return a list with one statement "v<position> = <expression>" per record of tape.
+
+    Keyword arguments:
+    tape -- A tape as described in _tape_source.
+    formats -- A dict from op codes to format strings of the expressions.
+    constant_format -- A function that returns the expression of a real number.
+    """
+    statements = []
+    for position, (op, left, right, value) in enumerate(tape):
+        if op == OP_CONST:
+            expr = constant_format(value)
+        elif op == OP_POW and tape[right][0] == OP_CONST and tape[right][3] in _MULTIPLIED_POWERS:
+            expr = _multiplied_power(statements, "v%d" % left, int(tape[right][3]),
+                                     "p%d_" % position)
+        else:
+            expr = formats[op].format(left=left, right=right, value=value)
+        statements.append("v%d = %s" % (position, expr))
+    return statements
+
+def _multiplied_power(statements, base, exponent, prefix):
+    """Return the expression of base ** exponent as a product and append the
+    statements that it needs to statements.
+
+    Keyword arguments:
+    statements -- The list of statements to append to.
+    base -- The name of the variable to raise.
+    exponent -- A positive integer.
+    prefix -- The prefix of the names of the new variables.
+
+    The power is calculated by repeated squaring so it needs at most
+    2*log2(exponent) multiplications.
+    """
+    factors = []
+    square = base
+    squarings = 0
+    while True:
+        if exponent & 1:
+            factors.append(square)
+        exponent >>= 1
+        if not exponent:
+            return " * ".join(factors)
+        squarings += 1
+        statements.append("%s%d = %s * %s" % (prefix, squarings, square, square))
+        square = "%s%d" % (prefix, squarings)
+
+def _c_constant(num):
+    """Return the C expression of the real number num.
+
+    Keyword arguments:
+    num -- A real number
+    """
+    if math.isnan(num):
+        return "NAN"
+    if math.isinf(num):
+        return "INFINITY" if num > 0 else "-INFINITY"
+    return num.hex() # Exact, unlike the decimal representation
+
+def _cache_dir():
+    """Return the directory of the compiled code, creating it if it does not exist.
+    It is funcmod in the XDG_CACHE_HOME environment variable (defaults to ~/.cache).
+    """
+    cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                             "funcmod")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def _write_atomically(path, text):
+    """Write text to the file at path so no other process reads half of it.
+
+    Keyword arguments:
+    path -- The path of the file.
+    text -- The string to write.
+    """
+    temporary_path = "%s.%d" % (path, os.getpid())
+    with open(temporary_path, "w") as temporary_file:
+        temporary_file.write(text)
+    os.replace(temporary_path, path)
+
+def _c_library(source):
+    """Return the ctypes library compiled from the C source code source.
+
+    Keyword arguments:
+    source -- The C source code of the library.
+
+    The libraries are cached by the SHA1 hash of their source so each source is
+    only compiled once. The C compiler is taken from the CC environment variable
+    (defaults to cc).
+    """
+    cache_dir = _cache_dir()
+    name = hashlib.sha1(source.encode()).hexdigest()
+    library_path = os.path.join(cache_dir, name + ".so")
+    if not os.path.exists(library_path):
+        source_path = os.path.join(cache_dir, name + ".c")
+        _write_atomically(source_path, source)
+        # Built under a unique name and then moved so no process loads half a library
+        build_path = "%s.%d.so" % (os.path.join(cache_dir, name), os.getpid())
+        compiler = os.environ.get("CC", "cc")
+        try:
+            subprocess.run([compiler, "-O3", "-fno-math-errno", "-fopenmp-simd", "-shared",
+                            "-fPIC", source_path, "-o", build_path, "-lm"],
+                           check=True, capture_output=True)
+            os.replace(build_path, library_path)
+        finally:
+            # Nothing of a failed build is left in the cache
+            if not os.path.exists(library_path):
+                for path in (build_path, source_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+    return ctypes.CDLL(library_path)
+
+def _div(numerator, denominator):
+    """Return numerator / denominator if denominator is not 0, otherwise return NaN.
+
+    Keyword arguments:
+    numerator -- A real number
+    denominator -- A real number
+    """
+    if denominator == 0:
+        return math.nan
+    return numerator / denominator
+
+def _sign(num):
+    """Return the sign of num as -1.0, 0.0 or 1.0.
+
+    Keyword arguments:
+    num -- A real number
+    """
+    if num == 0:
+        return 0.0
+    return math.copysign(1.0, num)
+
+def _pow(base, exponent):
+    """Return base ** exponent if it is a real number, otherwise return NaN.
+
+    Keyword arguments:
+    base -- A real number
+    exponent -- A real number
+    """
+    if base == 0 and exponent < 0 or base < 0 and exponent != math.floor(exponent):
+        return math.nan
+    return base ** exponent
+
+def _pow_array(bases, exponents):
+    """Return bases ** exponents elementwise with NaN where it is not a real number.
+
+    Keyword arguments:
+    bases -- A numpy array of real numbers OR a real number
+    exponents -- A numpy array of real numbers OR a real number
+    """
+    bases = np.asarray(bases, dtype=float)
+    return np.where((bases == 0) & (exponents < 0), np.nan, np.power(bases, exponents))
+
+def _defined(value, derivative):
+    """Return derivative if value is not NaN, otherwise return NaN.
+
+    Keyword arguments:
+    value -- A real number, the value of a function in some point
+    derivative -- A real number, the derivative of the function in the same point
+    """
+    if math.isnan(value):
+        return math.nan
+    return derivative
+
+def _divide_array(numerators, denominators):
+    """Return numerators / denominators elementwise with NaN where the denominator is 0.
+
+    Keyword arguments:
+    numerators -- A numpy array of real numbers OR a real number
+    denominators -- A numpy array of real numbers OR a real number
+    """
+    quotients = np.full(np.broadcast(numerators, denominators).shape, np.nan)
+    np.divide(numerators, denominators, out=quotients, where=denominators != 0)
+    return quotients
+
+# The numpy ufuncs of the functions in the math module, see Function.__init__
+_UFUNCS = {
+    math.exp: np.exp, math.log: np.log, math.sin: np.sin, math.asin: np.arcsin,
+    math.cos: np.cos, math.acos: np.arccos, math.tan: np.tan, math.atan: np.arctan,
+    math.sqrt: np.sqrt, math.fabs: np.abs, abs: np.abs, math.sinh: np.sinh,
+    math.cosh: np.cosh, math.tanh: np.tanh, math.log10: np.log10, math.log2: np.log2
+    }
+
+# The elementary Function instances by their scalar functions, see Function.__new__
+_PRIMITIVES = {}
 
 # Elementary Function instances
-exp = Function(math.exp)
+# The scalar evaluations use the math module which is faster on single numbers
+# while arrays are evaluated by the corresponding numpy ufuncs.
+exp = Function(math.exp, np.exp)
 def _log(num):
     """Return ln(num) if num > 0 otherwise return nan.
 
@@ -427,14 +2092,70 @@ def _log(num):
     num -- A real number
     """
     if num <= 0:
-        return float("nan")
+        return math.nan
     return math.log(num)
-log = Function(_log)
-sin = Function(math.sin)
-arcsin = Function(math.asin)
-cos = Function(math.cos)
-arccos = Function(math.acos)
-tan = Function(math.tan)
-arctan = Function(math.atan)
-sqrt = Function(math.sqrt)
-x = Function(lambda num: num) # Identity function
+def _log_array(arr):
+    """Return ln(arr) elementwise with NaN where arr <= 0.
+
+    Keyword arguments:
+    arr -- A numpy array of real numbers OR a real number
+    """
+    logs = np.full(np.shape(arr), np.nan)
+    np.log(arr, out=logs, where=arr > 0)
+    return logs
+log = Function(_log, _log_array)
+sin = Function(math.sin, np.sin)
+arcsin = Function(math.asin, np.arcsin)
+cos = Function(math.cos, np.cos)
+arccos = Function(math.acos, np.arccos)
+tan = Function(math.tan, np.tan)
+arctan = Function(math.atan, np.arctan)
+sqrt = Function(math.sqrt, np.sqrt)
+# Identity function, its arrays are copies so changing them leaves the points as they are
+x = Function(lambda num: num, lambda arr: np.array(arr, dtype=float))
+_PRIMITIVES.update({
+    math.exp: exp, math.log: log, _log: log, math.sin: sin, math.asin: arcsin,
+    math.cos: cos, math.acos: arccos, math.tan: tan, math.atan: arctan, math.sqrt: sqrt
+    })
+
+_signum = Function(_sign, np.sign) # Only used by the derivatives of abs
+# The change of variables of norm and its derivative, which are the same for every norm
+_SUBSTITUTION = x/(1-x**2)
+_SUBSTITUTION_DERIVATIVE = (1+x**2)/((1-x**2)**2)
+
+x._node = (OP_VAR, (), None)
+# The limit of a function that stays bounded without a known limit, see _tape_limit
+_BOUNDED = "bounded"
+# The elementary functions by their names in the kernels
+_LEAF_FUNCTIONS = {
+    "exp": exp, "_log": log, "sin": sin, "asin": arcsin, "cos": cos, "acos": arccos,
+    "tan": tan, "atan": arctan, "sqrt": sqrt, "_sign": _signum
+    }
+# The codes of the elementary functions in _interpret_tape
+_LEAF_CODES = {name: code for code, name in enumerate(_LEAF_FUNCTIONS)}
+for _name, _leaf in _LEAF_FUNCTIONS.items():
+    _leaf._node = (OP_LEAF, (), _name)
+# The derivatives of the elementary functions given their argument and value
+_LEAF_DERIVATIVES = {
+    "exp": lambda arg, value: value, "_log": lambda arg, value: 1/arg,
+    "sin": lambda arg, value: cos(arg), "asin": lambda arg, value: 1/sqrt(1 - arg**2),
+    "cos": lambda arg, value: -sin(arg), "acos": lambda arg, value: -1/sqrt(1 - arg**2),
+    "tan": lambda arg, value: 1 + value**2, "atan": lambda arg, value: 1/(1 + arg**2),
+    "sqrt": lambda arg, value: 0.5/value, "_sign": lambda arg, value: 0.0
+    }
+
+# The names that may be used by the kernel expressions
+_KERNEL_NAMESPACE = {
+    "exp": math.exp, "_log": _log, "sin": math.sin, "asin": math.asin,
+    "cos": math.cos, "acos": math.acos, "tan": math.tan, "atan": math.atan,
+    "sqrt": math.sqrt, "abs": abs, "_div": _div, "inf": math.inf, "nan": math.nan,
+    "_sign": _sign, "_pow": _pow, "_defined": _defined
+    }
+# The same names for kernels that evaluate numpy arrays
+_ARRAY_KERNEL_NAMESPACE = {
+    "exp": np.exp, "_log": _log_array, "sin": np.sin, "asin": np.arcsin,
+    "cos": np.cos, "acos": np.arccos, "tan": np.tan, "atan": np.arctan,
+    "sqrt": np.sqrt, "abs": np.abs, "_div": _divide_array, "inf": math.inf,
+    "nan": math.nan, "_sign": np.sign, "_pow": _pow_array,
+    "_defined": lambda values, derivatives: np.where(np.isnan(values), np.nan, derivatives)
+    }
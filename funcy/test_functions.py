@@ -1,7 +1,24 @@
 """Unittests for the functions module."""
 
 from funcy import functions
+import importlib
 import math
+import os
+import subprocess
+import sys
+from math import e, inf, isclose, isinf, isnan, pi, sqrt
+import numpy as np
+import pytest
+
+@pytest.fixture(autouse=True)
+def cache_home(monkeypatch, tmp_path):
+    """Keeps the code compiled by the tests out of the users cache."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    return tmp_path
+
+def _close(a, b, tol):
+    """Return whether a and b are at most tol apart."""
+    return abs(a - b) <= tol
 
 def test_eval():
     """Unittests for the eval functions."""
@@ -14,6 +31,21 @@ def test_call():
     assert functions.exp(0) == 1
     f = functions.exp(functions.log)
     assert f(3.3) == 3.3
+    # Other kinds of numbers are still numbers
+    assert f(np.float32(0.5)) == 0.5
+    assert f(np.int64(2)) == 2
+    assert (functions.x + np.int64(1))(1) == 2
+
+def test_slots():
+    """Tests that the instances only have the attributes of the Function class."""
+    f = functions.exp + functions.sin
+    assert not hasattr(f, "__dict__")
+    try:
+        f.attribute = 1
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError("instances should not accept new attributes")
 
 def test_addition():
     """Tests the addition of functions."""
@@ -36,6 +68,8 @@ def test_subtraction():
     assert f.eval(0) == -1
     f = 3 - functions.exp
     assert f.eval(0) == 2
+    assert f(np.array([0.0]))[0] == 2 and f.derivative()(0) == -1
+    assert 0 - functions.exp == -functions.exp
 
 def test_multiplication():
     """Tests the multiplication of functions."""
@@ -57,9 +91,12 @@ def test_divition():
     f = functions.exp / 2
     assert f.eval(0) == 0.5
     f = functions.exp / functions.sin #Is undefined at x=0
-    assert math.isnan(f.eval(0))
+    assert isnan(f.eval(0))
     f = 1 / functions.x
     assert f.eval(2) == 0.5
+    f = 3 / functions.x
+    assert f.eval(2) == 1.5
+    assert isnan(f.eval(0))
 
 def test_negation():
     """Tests the negation of functions."""
@@ -72,8 +109,7 @@ def test_abs():
     assert isinstance(f, functions.Function)
     assert f.eval(-5) == 5
     f = abs(functions.sin)
-    for i in range(100):
-        assert f.eval(i) >= 0
+    assert (f.eval_array(np.arange(100, dtype=np.float64)) >= 0).all()
 
 def test_pow():
     """Tests the exponentiation of functions"""
@@ -85,62 +121,421 @@ def test_pow():
     assert f.eval(2) == 16
     f = 3 ** functions.sin
     assert f.eval(0) == 1
+    f = 2 ** functions.x
+    assert f.eval(10) == 1024
+    for exponent in (2, 3, 4, 7, 2.0, 3.0):
+        f = functions.sin ** exponent
+        assert isclose(f.eval(1.2), math.sin(1.2) ** exponent, rel_tol=1e-15)
+        namespace = dict(functions._KERNEL_NAMESPACE)
+        exec(functions._tape_source(f._flat_tape()), namespace)
+        assert isclose(namespace["kernel"](1.2), f.eval(1.2), rel_tol=1e-15)
+    f = (-2) ** functions.x # Only a real number for integers
+    assert f.eval(3) == -8
+    assert isnan(f.eval(0.5))
+    # Arrays evaluate to NaN where the power is not a real number, like eval_many
+    points = np.array([0.0, 2.0])
+    for f in (functions.x ** -1, functions.x ** (functions.x - 1)):
+        assert np.array_equal(f(points), functions.eval_many([f], points)[0], equal_nan=True)
+        assert np.isnan(f(points)[0])
 
 def test_derivative():
     """Tests the derivative of functions"""
     f = functions.exp
     fd = f.derivative() # should be approximately the same as f
     assert isinstance(fd, functions.Function)
-    # The two point numerical method for differentiation ensures that f'(x) = f.derivative(x) + O(dx^2).
-    # Since dx^2 is 1e-8 we know that the result is at least 1e-7 close.
-    assert math.isclose(fd(0), f(0), abs_tol=1e-7)
-    assert math.isclose(fd(3), f(3), abs_tol=1e-7)
+    # The derivative is exact by default, the numeric mode is tested below.
+    assert _close(fd(0), f(0), 1e-7)
+    assert _close(fd(3), f(3), 1e-7)
     fd = functions.log.derivative()
     f = 1/functions.x
-    assert math.isclose(fd(3), f(3), abs_tol=1e-7)
-    assert math.isclose(fd(43), f(43), abs_tol=1e-7)
+    assert _close(fd(3), f(3), 1e-7)
+    assert _close(fd(43), f(43), 1e-7)
     # Tests that the behaviour of the derivative is not broken in weird points.
     f = abs(functions.x).derivative()
-    # Should be 0 since the algorithm takes point on equal distances around the point
+    # Should be 0 since the derivative of abs is taken as the sign of its argument
     assert f.eval(0) == 0
     f = abs(functions.sin).derivative()
     assert f.eval(0) == 0
+    # The two point numerical method for differentiation ensures that f'(x) = f.derivative(x) + O(dx^2).
+    # Should be 0 since the algorithm takes point on equal distances around the point
+    f = abs(functions.sin).derivative(mode="numeric")
+    assert f.eval(0) == 0
+    fd = functions.exp.derivative(mode="numeric")
+    assert _close(fd(3), functions.exp(3), 1e-7)
+    # Not defined where the function is not defined, also when its neighbours are
+    fd = (functions.x/functions.x).derivative(mode="numeric")
+    assert isnan(fd(0)) and np.isnan(fd(np.array([0.0]))[0])
+
+def test_derivative_exact():
+    """Tests that exact derivatives agree with the derivatives calculated by hand."""
+    f = functions.sin(functions.log(functions.x)) * functions.exp(functions.x**2)
+    fd = f.derivative()
+    def derivative(num):
+        return (math.cos(math.log(num))/num + 2*num*math.sin(math.log(num))) * math.exp(num**2)
+    points = np.array([0.3, 1, 2.5])
+    for point, fd_eval in zip(points, fd(points)):
+        assert isclose(fd(float(point)), derivative(point), rel_tol=1e-12)
+        assert isclose(fd_eval, derivative(point), rel_tol=1e-12)
+    assert isnan(fd(-1)) and np.isnan(fd(np.array([-1.0]))[0])
+    fd = (2**functions.x / functions.sqrt + functions.arctan(3*functions.x)).derivative()
+    assert isclose(fd(2), math.log(2)*2**1.5 - 2**-0.5 + 3/37, rel_tol=1e-12)
+    assert abs(functions.x).derivative()(np.array([-2.0, 0.0, 2.0])).tolist() == [-1, 0, 1]
+    assert functions.x.derivative()(np.array([1.0, 2.0])).tolist() == [1, 1]
+    # Exact derivatives are built from the elementary functions themselves
+    fdd = (functions.sin(functions.x**2)).derivative().derivative()
+    assert fdd._flat_tape() is not None
+    assert isclose(fdd(1), 2*math.cos(1) - 4*math.sin(1), rel_tol=1e-12)
+    # Functions that are not built from the elementary functions fall back to numeric
+    fd = functions.Function(math.cosh).derivative()
+    assert isclose(fd(1), math.sinh(1), rel_tol=1e-7)
 
 def test_integrate():
     """Tests the integral of functions"""
     f = functions.sin
-    assert math.isclose(f.integrate(0, math.pi, tol=1e-10), 2, abs_tol=1e-10)
-    assert math.isclose(f.integrate(0, math.pi*2, tol=1e-10), 0, abs_tol=1e-10)
+    assert _close(f.integrate(0, pi, tol=1e-10), 2, 1e-10)
+    assert _close(f.integrate(0, pi*2, tol=1e-10), 0, 1e-10)
     f = functions.x
-    assert math.isclose(f.integrate(0, 2, tol=1e-10), 2, abs_tol=1e-10)
+    assert _close(f.integrate(0, 2, tol=1e-10), 2, 1e-10)
     f = 1/functions.x
-    assert math.isclose(f.integrate(1, math.e, tol=1e-10), 1, abs_tol=1e-10)
+    assert _close(f.integrate(1, e, tol=1e-10), 1, 1e-10)
     # Generalized integrals tested below
     f = 1/(functions.x**0.5)
-    assert math.isclose(f.integrate(0, 1, tol=1e-10), 2, abs_tol=1e-10)
+    # The default relative tolerance of isclose allows for the shift of the singularities
+    assert isclose(f.integrate(0, 1, tol=1e-10), 2, abs_tol=1e-10)
     f = 1/((functions.x**2)**(1/3))
-    assert math.isclose(f.integrate(0, 1, tol=1e-10), 3, abs_tol=1e-10)
+    assert isclose(f.integrate(0, 1, tol=1e-10), 3, abs_tol=1e-10)
     # Test some divergent integrals
     f = 1/(functions.x**2)
-    assert math.isnan(f.integrate(0,1))
+    assert isnan(f.integrate(0,1))
     f = 1/(functions.x - 1)**2
-    assert math.isnan(f.integrate(0,2))
+    assert isnan(f.integrate(0,2))
+    # Divergent at the endpoints, found before integrating
+    for f, start, end in ((1/functions.x**2, 0, 1), (1/(functions.x - 1)**2, 0, 1),
+                          (1/functions.x, 0, 1), (functions.sqrt, -1, 1)):
+        assert functions._diverges_at_endpoints(f.eval_array, start, end)
+        assert isnan(f.integrate(start, end))
+    for f in (1/functions.x**0.5, functions.log, functions.exp):
+        assert not functions._diverges_at_endpoints(f.eval_array, 0, 1)
 
 def test_norm():
     """Tests the norm function in the functions module."""
-    assert math.isnan(functions.norm(functions.exp))
-    assert math.isnan(functions.norm(functions.sin))
-    assert math.isnan(functions.norm(functions.tan))
-    assert math.isnan(functions.norm(functions.x))
+    assert isnan(functions.norm(functions.exp))
+    assert isnan(functions.norm(functions.sin))
+    assert isnan(functions.norm(functions.tan))
+    assert isnan(functions.norm(functions.x))
     f = functions.exp(-functions.x**2)
-    norm = math.sqrt(math.sqrt(math.pi/2))
-    assert math.isclose(functions.norm(f, tol=1e-5), norm, abs_tol=1e-5)
-    norm = math.sqrt(math.pi)
-    assert math.isclose(functions.norm(f, norm_type="L1", tol=1e-5), norm, abs_tol=1e-5)
+    norm = sqrt(sqrt(pi/2))
+    assert _close(functions.norm(f, tol=1e-5), norm, 1e-5)
+    norm = sqrt(pi)
+    assert _close(functions.norm(f, norm_type="L1", tol=1e-5), norm, 1e-5)
+    l1_norm, l2_norm, l3_norm = functions.norms(f, ("L1", "L2", "L3"), tol=1e-5)
+    assert _close(l1_norm, norm, 1e-5)
+    assert _close(l2_norm, sqrt(sqrt(pi/2)), 1e-5)
+    assert _close(l3_norm, (pi/3)**(1/6), 1e-5)
+    assert [isnan(norm) for norm in functions.norms(functions.x, ("L1", "L2"))] == [True]*2
+    with pytest.raises(ValueError):
+        functions.norms(f, ("L2", "K2"))
     f = f * functions.sin
-    norm = math.sqrt(1/4 * (math.sqrt(2*math.pi) - math.sqrt(2*math.pi/math.e)))
-    assert math.isclose(functions.norm(f, tol=1e-5), norm, abs_tol=1e-5)
+    norm = sqrt(1/4 * (sqrt(2*pi) - sqrt(2*pi/e)))
+    assert _close(functions.norm(f, tol=1e-5), norm, 1e-5)
     f = 1/functions.x
-    assert math.isnan(functions.norm(f))
+    assert isnan(functions.norm(f))
     f = f**2
-    assert math.isnan(functions.norm(f))
+    assert isnan(functions.norm(f))
+    assert isnan(functions.norm(functions.arctan + 1))
+    # The integral of a norm that is calculated again is looked up
+    f = functions.exp(-functions.x**2) * functions.cos
+    norm = functions.norm(f)
+    hits = functions._tape_integral.cache_info().hits
+    assert functions.norm(functions.exp(-functions.x**2) * functions.cos) == norm
+    assert functions._tape_integral.cache_info().hits == hits + 1
+
+def test_tape_limit():
+    """Tests the limits in ±infinity that norm reads from the tapes."""
+    x = functions.x
+    limits = [(functions.exp, inf, 0.0), (functions.sin(x)/x, 0.0, 0.0),
+              (functions.arctan, pi/2, -pi/2), (1 + 2**-x, 1.0, inf),
+              (functions.sin, functions._BOUNDED, functions._BOUNDED),
+              (x * functions.exp(-x), None, -inf), (functions.tan, None, None)]
+    for f, positive, negative in limits:
+        tape = f._flat_tape()
+        assert functions._tape_limit(tape, 1) == positive
+        assert functions._tape_limit(tape, -1) == negative
+
+def test_eval_array():
+    """Tests the evaluation of functions on numpy arrays."""
+    points = np.array([0.5, 1, 2, 3])
+    f = functions.sin(functions.log) * functions.exp(functions.arctan(functions.x**2))
+    f_evals = f(points)
+    assert isinstance(f_evals, np.ndarray)
+    for point, f_eval in zip(points, f_evals):
+        assert isclose(f_eval, f(float(point)))
+    f = 1 / functions.x
+    assert np.array_equal(f(points), 1 / points)
+    assert isnan(f(np.array([0.0]))[0])
+    f = functions.log
+    assert np.all(np.isnan(f(np.array([-1.0, 0.0]))))
+    x_evals = functions.x(points) # A new array, not the points themselves
+    x_evals += 1
+    assert np.array_equal(points, [0.5, 1, 2, 3])
+    f = functions.Function(lambda num: 2*num)
+    assert np.array_equal(f(points), 2*points)
+    fd = functions.exp.derivative()
+    assert np.allclose(fd(points), np.exp(points), atol=1e-7)
+    fd = abs(functions.x).derivative()
+    assert fd(np.array([0.0]))[0] == 0
+    f = functions.Function(math.cosh) # Evaluated by the numpy ufunc
+    assert np.allclose(f(points), np.cosh(points))
+
+def test_eval_grid():
+    """Tests the grid of evaluation points used for plotting."""
+    domain, f_evals = functions.log._get_eval_grid(-1, 1, 0.25)
+    assert np.array_equal(domain, np.arange(-1, 1.25, 0.25))
+    assert np.all(np.isnan(f_evals[:5])) and f_evals[-1] == 0
+    domain, _ = functions.log._get_eval_grid(-1, 1, 0.3) # Not a whole number of steps
+    assert domain[0] == -1 and domain[-1] == 1 and np.all(np.diff(domain) <= 0.3)
+    domain, f_evals = functions.log._get_eval_grid(1, 0, 0.1) # Only the endpoint
+    assert np.array_equal(domain, [0.0]) and np.isnan(f_evals[0])
+    with pytest.raises(ValueError):
+        functions.log._get_eval_grid(0, 1, 0)
+
+def test_eval_many():
+    """Tests the evaluation of several functions on the same points."""
+    points = np.array([-1, 0.5, 2])
+    g = functions.sin(functions.x)**2
+    funcs = [g, functions.log(functions.x) * g, functions.Function(math.cosh), functions.x]
+    evals = functions.eval_many(funcs, points)
+    assert evals.shape == (4, 3)
+    for func, row in zip(funcs, evals):
+        assert np.allclose(row, func(points), rtol=1e-12, equal_nan=True)
+
+def test_integrate_tanh_sinh():
+    """Tests the integral of functions by the tanh-sinh quadrature."""
+    x = functions.x
+    for f, start, end, integral in ((functions.sin, 0, pi, 2), (x, 0, 2, 2),
+                                    (1/x**0.5, 0, 1, 2), (1/((x**2)**(1/3)), 0, 1, 3),
+                                    (functions.log, 0, 1, -1), (functions.sin, pi, 0, -2)):
+        assert _close(f.integrate(start, end, tol=1e-10, method="tanh-sinh"), integral, 1e-10)
+    for f, start, end in ((1/x**2, 0, 1), (1/(x - 1)**2, 0, 2), (functions.sqrt, -1, 1)):
+        assert isnan(f.integrate(start, end, method="tanh-sinh"))
+    with pytest.raises(ValueError):
+        functions.sin.integrate(0, 1, method="romberg")
+
+def test_integrate_fixed():
+    """Tests the integral of functions on a fixed grid."""
+    f = functions.sin
+    assert _close(f.integrate_fixed(0, pi), 2, 1e-10)
+    f = functions.x**3 # Exact for polynomials of degree 3
+    assert _close(f.integrate_fixed(-1, 2, n=1), 3.75, 1e-12)
+    f = functions.Function(lambda num: num**2) # No vectorized version
+    assert _close(f.integrate_fixed(0, 3, n=10), 9, 1e-12)
+    assert isnan(functions.log.integrate_fixed(0, 1))
+
+def test_integrate_compiled():
+    """Tests that compiled integrals agree with the pure python integration."""
+    f = functions.exp(-functions.x**2) * functions.sin + 1/abs(functions.x)**0.5
+    integral = functions._adaptive_simpson(f.eval, 0, 2, 1e-8, 1e10, -1)[0]
+    assert _close(f.integrate(0, 2, tol=1e-8), integral, 1e-12)
+    f = functions.Function(lambda num: num**2) # Cannot be compiled
+    assert _close(f.integrate(0, 3, tol=1e-10), 9, 1e-10)
+
+def test_integrate_array():
+    """Tests that integrating the intervals of a level at once agrees with python."""
+    x = functions.x
+    for f, start, end in ((functions.exp(-x**2) * functions.sin(5*x), 0, 10),
+                          (1/x**0.5, 0, 1), (1/abs(x - 0.3)**0.5, 0, 1.5),
+                          (functions.log(x) * functions.sin**2, 0, 50)):
+        integral = functions._adaptive_simpson(f.eval, start, end, 1e-8, 1e10, -1)[0]
+        assert _close(functions._adaptive_simpson_array(f.eval_array, start, end,
+                                                        1e-8, 1e10),
+                      integral, 1e-12)
+    for f, start, end in ((1/x**2, 0, 1), (functions.sqrt, -1, 1)):
+        assert isnan(functions._adaptive_simpson_array(f.eval_array, start, end,
+                                                            1e-5, 1e10))
+    f = functions.Function(math.cosh) # Evaluated by the numpy ufunc
+    assert _close(f.integrate(0, 1, tol=1e-10), math.sinh(1), 1e-10)
+
+def test_integrate_c(monkeypatch):
+    """Tests that integrals compiled by the C compiler agree with the python ones."""
+    monkeypatch.setattr(functions, "_numba", lambda: None)
+    f = functions.sin(1/functions.x) # Needs too many intervals for python
+    integral = functions._adaptive_simpson(f.eval, 0.001, 1, 1e-10, 1e10, -1)[0]
+    c_library = functions._c_library
+    monkeypatch.setattr(functions, "_c_library", None) # Only compile builds libraries
+    assert _close(f.integrate(0.001, 1, tol=1e-10), integral, 1e-12)
+    monkeypatch.setattr(functions, "_c_library", c_library)
+    if f._library() is None: # No C compiler
+        return
+    functions._tape_integral.cache_clear()
+    assert _close(f.compile().integrate(0.001, 1, tol=1e-10), integral, 1e-12)
+    completed = functions.ctypes.c_int()
+    f._library().adaptive_simpson(0.001, 1, 1e-10, 1e10, 10, functions.ctypes.byref(completed))
+    assert completed.value == 0
+    for f in (functions.log, 1/abs(functions.x - 0.3)**0.5):
+        integral = f._library().adaptive_simpson(0, 1.5, 1e-8, 1e10, -1,
+                                                 functions.ctypes.byref(completed))
+        assert completed.value == 1
+        assert _close(integral, functions._adaptive_simpson(f.eval, 0, 1.5, 1e-8, 1e10, -1)[0],
+                      1e-12)
+
+def test_tape():
+    """Tests that the tapes of functions evaluate as the functions themselves."""
+    g = functions.exp + functions.sin
+    f = (functions.x**2 - 1/functions.x)(g) * abs(-g)
+    assert f._tape is None # Only built when it is needed
+    namespace = dict(functions._KERNEL_NAMESPACE)
+    exec(functions._tape_source(f._flat_tape()), namespace)
+    for num in (-2.5, 0.5, 1, 3):
+        assert isclose(namespace["kernel"](num), f(num))
+    # g only appears once on the tape even though f uses it three times
+    assert len([record for record in f._flat_tape() if record[0] == functions.OP_LEAF]) == 2
+    assert functions.Function(math.cosh)._flat_tape() is None
+
+def test_interpret_tape():
+    """Tests that interpreting tapes evaluates as the functions themselves."""
+    x = functions.x
+    f = (functions.exp(functions.sin(x)) + functions.log(x) * functions.arcsin(x/4)
+         - functions.cos(x)**x / functions.arccos(x/5) + functions.tan(-x)
+         * functions.arctan(abs(x - 2)) + functions.sqrt(x)**3)
+    for g in (f, f.derivative()): # The derivative adds _sign and _defined
+        arrays = functions._tape_arrays(g._flat_tape())
+        for num in (0.5, 1.0, 1.5): # Where cos(x)**x is a real number
+            assert _close(functions._interpret_tape(num, *arrays), g(num), 1e-12)
+    if functions._numba() is not None:
+        interpreter, adaptive_simpson = functions._jit_interpreter()
+        arrays = functions._tape_arrays(f._flat_tape())
+        assert _close(interpreter(1.5, *arrays), f(1.5), 1e-12)
+        assert isnan(interpreter(-1.0, *arrays))
+        integral, completed = adaptive_simpson(interpreter, 0.5, 1.5, 1e-8, 1e10, -1,
+                                               *functions._tape_arrays(f._flat_tape()))
+        assert completed
+        assert _close(integral, functions._adaptive_simpson(f.eval, 0.5, 1.5, 1e-8, 1e10, -1)[0],
+                      1e-12)
+
+def test_compile():
+    """Tests that compiled functions evaluate as the functions themselves."""
+    g = functions.exp + functions.sin
+    f = (functions.x**2 - 1/functions.x)(g) * abs(-g) + functions.log(functions.x)
+    fc = f.compile()
+    assert isinstance(fc, functions.Function)
+    points = np.array([-2.5, 0.5, 1, 3])
+    for point, fc_eval in zip(points, fc(points)):
+        point = float(point)
+        if isnan(f(point)):
+            assert isnan(fc(point))
+            assert isnan(fc_eval)
+        else:
+            assert _close(fc(point), f(point), 1e-12)
+            assert isclose(fc_eval, fc(point))
+    assert isnan(fc(-1)) and isnan(fc(0))
+    f = functions.Function(math.cosh) # Cannot be compiled
+    assert f.compile() is f
+
+def test_compile_failure(monkeypatch, cache_home):
+    """Tests that a failed build leaves nothing in the cache."""
+    monkeypatch.setenv("CC", "false")
+    f = functions.sin(functions.x) + 7
+    assert f.compile() is f
+    assert os.listdir(functions._cache_dir()) == []
+
+def test_jit(cache_home):
+    """Tests that functions compiled by numba evaluate as the functions themselves."""
+    f = functions.exp(-functions.x**2) * functions.sin + functions.log(functions.x)
+    fj = f.jit()
+    if functions._numba() is None:
+        assert fj is f
+        return
+    assert isclose(fj(2.5), f(2.5), rel_tol=1e-12)
+    assert isnan(fj(-1))
+    # Numeric derivatives of compiled functions evaluate the compiled kernel
+    assert isclose(fj.derivative(mode="numeric")(2), f.derivative()(2), rel_tol=1e-7)
+    for size in (10, 2000): # Small arrays are evaluated by numpy
+        points = np.linspace(-1, 3, size)
+        assert np.allclose(fj(points), f(points), rtol=1e-12, equal_nan=True)
+    assert list(cache_home.glob("funcmod/*.py")) # Cached for the next run
+    # numba imports the module of a kernel by its name when it loads the cached code
+    assert importlib.import_module(fj._function.py_func.__module__)
+    f = functions.Function(math.cosh) # Cannot be compiled
+    assert f.jit() is f
+
+def test_lazy_numba():
+    """Tests that numba is only imported when something is compiled by it."""
+    code = "import sys; import funcy.functions; assert 'numba' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True,
+                   cwd=os.path.dirname(os.path.dirname(functions.__file__)))
+
+def test_simplification():
+    """Tests that neutral operations return the function itself."""
+    f = functions.exp * functions.sin
+    assert f + 0 is f
+    assert 0 + f is f
+    assert f - 0 is f
+    assert f * 1 is f
+    assert 1 * f is f
+    assert f / 1 is f
+    assert f ** 1 is f
+    assert -(-f) is f
+    assert (e ** f)(1.5) == functions.exp(f)(1.5)
+    # Multiplying by zero keeps the points where the function is undefined
+    f = functions.log * 0
+    assert isnan(f(-1))
+    assert f(2) == 0
+
+def test_interning():
+    """Tests that equal functions are shared and compare equal."""
+    f = functions.exp(functions.sin) + 1
+    assert functions.exp(functions.sin) + 1 is f
+    assert -f is -f and abs(f) is abs(f)
+    assert f.derivative() is f.derivative()
+    assert f.derivative() is not f.derivative(dx=0.001)
+    g = functions.exp(functions.sin) + 1.0 # Not the same constant but the same tape
+    assert g is not f and g == f and hash(g) == hash(f)
+    assert f != functions.exp(functions.sin) + 2
+    assert functions.x * 0.0 is not functions.x * -0.0
+    f = functions.Function(math.cosh) # Only equal to itself
+    assert f == f and f != functions.Function(math.cosh) and f != functions.cos
+    f = functions.x + 10**400 # Too large for a tape, hashed as the opaque functions
+    assert f._flat_tape() is None and f in {f} and f != functions.x + 1e300
+    # The functions of the math module give the elementary functions
+    assert functions.Function(math.exp) is functions.exp
+    assert functions.Function(math.log) is functions.log
+    assert functions.Function(math.exp, np.exp) is not functions.exp
+
+def test_integrate_interior_singularity():
+    """Tests that integrals with a singularity inside the interval terminate."""
+    f = 1/abs(functions.x - 0.3)**0.5
+    integral = 2*sqrt(0.3) + 2*sqrt(1.2)
+    assert _close(f.integrate(0, 1.5), integral, 1e-3)
+    assert _close(functions._adaptive_simpson(f.eval, 0, 1.5, 1e-5, 1e10, -1)[0],
+                  integral, 1e-3)
+    f = 1/abs(functions.x - 0.3)
+    assert not isinf(functions._adaptive_simpson(f.eval, 0, 1.5, 1e-5, 1e10, -1)[0])
+
+def test_integrate_undefined():
+    """Tests integrals over intervals where the function is partly undefined."""
+    f = functions.Function(lambda num: sqrt(num) if num >= 0 else float("nan"))
+    assert isnan(f.integrate(-1, 1))
+    assert isnan(f.integrate(-2, -1))
+    if functions._numba() is not None:
+        kernel = functions.sqrt._kernel()
+        integral, _ = functions._jit_adaptive_simpson()(kernel, -1.0, 1.0, 1e-5, 1e10, -1)
+        assert isnan(integral)
+
+def test_integrate_evaluations():
+    """Tests that every interval of the integration needs three new evaluations."""
+    points = []
+    def counted(num):
+        points.append(num)
+        return math.exp(-num**2) * math.sin(5*num)
+    functions.Function(counted).integrate(0, 3, tol=1e-8)
+    # The samples near the endpoints that check for divergence come first
+    del points[:2*len(functions._ENDPOINT_DISTANCES)]
+    # Four evaluations for the first interval and then three for each interval,
+    # the intervals form a binary tree so there is an odd number of them.
+    intervals, remainder = divmod(len(points) - 4, 3)
+    assert remainder == 0 and intervals % 2 == 1 and intervals > 1
+    assert len(set(points)) == len(points)
+    # An interior singularity at a midpoint terminates with few evaluations
+    points.clear()
+    (functions.Function(counted) / (functions.x - 1.5)**2).integrate(0, 3)
+    assert len(points) < 10**5